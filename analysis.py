@@ -0,0 +1,199 @@
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import islice
+from multiprocessing import Pool
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from main import *
+
+
+@dataclass
+class Evaluation:
+    """
+    Result of evaluating single position
+    :param index: index of the position in the given positions
+    :param move: chosen move. None if the position couldn't be evaluated
+    :param score: score of the chosen move
+    :param options: the best candidates of the player to move, [Move, score], the best first
+    :param forced_win: whether the player to move can win whatever the opponent does
+    :param error: why the position couldn't be evaluated
+    """
+    index: int
+    move: Union[Move, None]
+    score: int = 0
+    options: List[Tuple[Move, int]] = field(default_factory=list)
+    forced_win: bool = False
+    error: Union[str, None] = None
+
+
+Position = Union[str, List[Move]]
+
+# shared by all positions evaluated in this process
+_cache = SearchCache()
+
+
+def position_table(position: Position, size: int = None) -> Table:
+    """
+    Create computed table from position
+    :param position: List[Move], moves in the format of data file (`count,pn;y;x,...`),
+        or compact board for `Table.from_board`
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :return: Table
+    """
+    if isinstance(position, str):
+        if ',' not in position:
+            return Table.from_board(position, size)
+        position = parse_data(position)[1]
+    table = Table(list(position), size)
+    move, is_win = table.compute()
+    if move:
+        if is_win:
+            raise ValueError('Player number {} already won by placing, {}'.format(move.program_number, move.point))
+        raise ValueError("Player number {} can't place here, {}".format(move.program_number, move.point))
+    return table
+
+
+def evaluate_position(index: int, position: Position, depth: int = 1, best: int = 5, top: int = 5,
+                      size: int = None) -> Evaluation:
+    """
+    Evaluate single position for the player to move
+    :param index: index of the position
+    :param position: position for `position_table`
+    :param depth: depth of `choose_next_move`
+    :param best: best of `choose_next_move`
+    :param top: how many candidates to be returned
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :return: Evaluation
+    """
+    try:
+        table = position_table(position, size)
+    except ValueError as e:
+        return Evaluation(index, None, error=str(e))
+    table.cache = _cache
+
+    me = table.me
+    move, oc = table.choose_next_move(me, depth, best)
+    ranking = table.rank_points(me)
+    # the search blocks the opponent's five instead of the best ranked move, which can't win then
+    return Evaluation(index, move, oc.score,
+                      [(Move(me, point), ow.score) for ow, point in ranking[:top]],
+                      oc.winnable_with_skip)
+
+
+def _evaluate(args: tuple) -> Evaluation:
+    return evaluate_position(*args)
+
+
+def _evaluate_chunk(chunk: List[tuple]) -> List[Evaluation]:
+    return [evaluate_position(*args) for args in chunk]
+
+
+def evaluate_positions(positions: Iterable[Position], depth: int = 1, best: int = 5, top: int = 5,
+                       size: int = None, processes: int = None, chunksize: int = 16) -> Iterator[Evaluation]:
+    """
+    Evaluate many positions and yield Evaluation of each one in the given order, as soon as it is computed.
+    Positions are read lazily, so it works with a generator of positions much larger than memory.
+    :param positions: positions for `position_table`
+    :param depth: depth of `choose_next_move`
+    :param best: best of `choose_next_move`
+    :param top: how many candidates to be returned for each position
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :param processes: number of worker processes. defaults to the number of CPUs. 0 to evaluate in this process
+    :param chunksize: how many positions are sent to a worker at once. 2 chunks for each worker are read ahead
+    :return: Iterator[Evaluation]
+    """
+    tasks = ((i, position, depth, best, top, size) for i, position in enumerate(positions))
+    if processes == 0:
+        yield from map(_evaluate, tasks)
+        return
+
+    workers = processes or os.cpu_count() or 1
+    chunks = iter(lambda: list(islice(tasks, chunksize)), [])
+    with Pool(workers) as pool:
+        # at most 2 chunks for each worker are in flight, so neither positions nor results pile up
+        pending = deque(pool.apply_async(_evaluate_chunk, (chunk,)) for chunk in islice(chunks, 2 * workers))
+        while pending:
+            evaluations = pending.popleft().get()
+            pending.extend(pool.apply_async(_evaluate_chunk, (chunk,)) for chunk in islice(chunks, 1))
+            yield from evaluations
+
+
+@dataclass
+class PlyAnalysis:
+    """
+    Analysis of single move in a game
+    :param ply: index of the move in the game
+    :param played: the move actually played
+    :param preferred: the move the engine prefers
+    :param preferred_score: score of `preferred`
+    :param played_score: score of `played`
+    :param missed_win: whether the player had a winning move but `played` isn't one
+    :param threats: points where the opponent would make a winning move, if the player ignored them
+    :param foul: whether `played` is foul. the analysis stops here
+    :param win: whether `played` won the game
+    """
+    ply: int
+    played: Move
+    preferred: Move
+    preferred_score: int
+    played_score: int
+    missed_win: bool
+    threats: List[Point]
+    foul: bool = False
+    win: bool = False
+
+
+def winning_points(table: Table, program_number: int) -> List[Point]:
+    """
+    return points where `program_number` makes five, or turns the table into `winnable_with_skip` by placing
+    :param table: table to be computed
+    :param program_number: Compute as
+    :return: List[Point]
+    """
+    current = OptionContainer()
+    for line in chain.from_iterable(table.get_lines(program_number).values()):
+        current = current.add(table.find_options(line))
+    already = current.winnable_with_skip
+
+    return [point for oc, point in table.rank_points(program_number)
+            if any(option.type is OptionType.Win for option in oc.options) or
+            (oc.winnable_with_skip and not already)]
+
+
+def analyse_game(moves: List[Move], depth: int = 2, best: int = 3, size: int = None) -> Iterator[PlyAnalysis]:
+    """
+    Replay moves (e.g. from `load_data`) on a single table and yield analysis of each move.
+    The table and its cache are kept through the game, so positions searched at a ply are reused by the next ones.
+    :param moves: moves of the game
+    :param depth: depth of `choose_next_move`
+    :param best: best of `choose_next_move`
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :return: Iterator[PlyAnalysis]
+    """
+    table = Table([], size)
+    for ply, move in enumerate(moves):
+        program_number = move.program_number
+        preferred, _ = table.choose_next_move(program_number, depth, best)
+
+        # both moves are scored by `score_point`, as the score of the search is 0 for forced moves
+        scores = {point: ow for ow, point in table.rank_points(program_number)}
+        played, chosen = [scores[point] if point in scores else table.score_point(program_number, point)
+                          for point in (move.point, preferred.point)]
+
+        wins, threats = [], []
+        if table.moves_count >= 3:
+            wins = winning_points(table, program_number)
+            threats = winning_points(table, table.opponent(program_number))
+
+        analysis = PlyAnalysis(ply, move, preferred, chosen.score, played.score,
+                               bool(wins) and move.point not in wins, threats)
+        if table.compute_move(move):
+            analysis.foul = True
+            yield analysis
+            return
+        table.cache.prune(table.moves_count)
+        analysis.win = table.is_win(program_number, move.point)
+        yield analysis
+        if analysis.win:
+            return
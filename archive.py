@@ -0,0 +1,290 @@
+import argparse
+import heapq
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+from main import *
+from selfplay import MANIFEST, write_manifest
+
+RECORD = struct.Struct('<QIH')  # hash of the position, game and ply, sorted by hash in a segment
+
+_SYMMETRIC_KEYS: Dict[int, List[Tuple[int, ...]]] = {}  # size to keys of each stone
+
+
+def symmetries(point: Point, size: int) -> Tuple[Point, ...]:
+    """
+    return the 8 points which `point` is moved to by rotations and reflections of the table
+    :param point: point on the table
+    :param size: size of the table
+    :return: Tuple[Point, ...]. the first one is `point` itself
+    """
+    y, x, n = point.y, point.x, size - 1
+    return (Point(y, x), Point(x, n - y), Point(n - y, n - x), Point(n - x, y),
+            Point(y, n - x), Point(x, y), Point(n - y, x), Point(n - x, n - y))
+
+
+def symmetric_keys(size: int) -> List[Tuple[int, ...]]:
+    """
+    return zobrist keys of each stone on each symmetry of the table, indexed by
+    `colour * size * size + y * size + x`, where colour is 0 for black and 1 for white
+    :param size: size of the table
+    :return: List[Tuple[int, ...]]
+    """
+    keys = _SYMMETRIC_KEYS.get(size)
+    if keys is None:
+        keys = _SYMMETRIC_KEYS[size] = [tuple(zobrist(p, colour + 1) for p in symmetries(Point(y, x), size))
+                                        for colour in (0, 1) for y in range(size) for x in range(size)]
+    return keys
+
+
+def position_hashes(moves: Iterable[Move], size: int) -> Iterator[int]:
+    """
+    yield the hash of the position after each move, same for all symmetries of the position.
+    stones are keyed by colour, so the player who moved first is black whatever its program_number is
+    :param moves: moves of a game
+    :param size: size of the table
+    :return: Iterator[int]
+    """
+    keys = symmetric_keys(size)
+    hashes = (0,) * 8
+    black = None
+    placed = set()
+    for move in moves:
+        if not (0 <= move.point.y < size and 0 <= move.point.x < size and move.program_number in (1, 2)):
+            raise ValueError('invalid move: {}'.format(move))
+        if move.point in placed:
+            raise ValueError('point is already placed: {}'.format(move))
+        placed.add(move.point)
+        if black is None:
+            black = move.program_number
+        colour = 0 if move.program_number == black else 1
+        key = keys[colour * size * size + move.point.y * size + move.point.x]
+        hashes = tuple(h ^ k for h, k in zip(hashes, key))
+        yield min(hashes)
+
+
+def canonical_hash(position: Union[Table, Iterable[Move]], size: int = None) -> int:
+    """
+    return the hash of a position, same for all symmetries of it. the first move is black,
+    and the order of the others doesn't matter
+    :param position: Table or moves of the position
+    :param size: size of the table. defaults to the size of Table or `config.TABLE_SIZE`
+    :return: int
+    """
+    if isinstance(position, Table):
+        size = size or position.size
+        position = position.moves
+    size = size or config.TABLE_SIZE
+    result = 0
+    for result in position_hashes(position, size):
+        pass
+    return result
+
+
+class PositionIndex:
+    def __init__(self, directory: str, size: int = None):
+        """
+        Index of every position of the games in an archive, to find the games which reached a position.
+        An archive is a text file of a game per line in the format of data file, and the game ID is the index
+        of the line. `update` reads the lines appended since the last update, and writes their positions into
+        a new segment file of records sorted by `canonical_hash`, so `find` is a binary search in each segment.
+        Segments are merged into one when there are more than `config.INDEX_SEGMENTS` of them.
+        :param directory: directory of the index. created if not exists
+        :param size: size of the table of the games. defaults to `config.TABLE_SIZE`
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = read_index(directory)
+        size = size or self.manifest['size'] or config.TABLE_SIZE
+        if self.manifest['size'] is None:
+            self.manifest['size'] = size
+        elif self.manifest['size'] != size:
+            raise ValueError('index in {} is of size {}, not {}'.format(directory, self.manifest['size'], size))
+        self.size = size
+        self.maps: Dict[str, mmap.mmap] = {}
+
+    def __enter__(self) -> 'PositionIndex':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        close segment files
+        """
+        for mapped in self.maps.values():
+            mapped.close()
+        self.maps = {}
+
+    @property
+    def games(self) -> int:
+        """
+        how many games are indexed, including the invalid ones
+        """
+        return self.manifest['games']
+
+    def update(self, archive: str, segment_size: int = 1 << 22) -> int:
+        """
+        index the games appended to `archive` since the last update. a line is read only after its newline
+        :param archive: path of the archive
+        :param segment_size: records per segment. at most this many records are kept in memory
+        :return: int. how many games are added
+        """
+        if self.manifest['archive'] not in (None, os.path.abspath(archive)):
+            raise ValueError('index in {} is of {}'.format(self.directory, self.manifest['archive']))
+        self.manifest['archive'] = os.path.abspath(archive)
+        if os.path.getsize(archive) < self.manifest['offset']:
+            raise ValueError('{} is shorter than indexed, rebuild the index'.format(archive))
+
+        added = 0
+        records: List[Tuple[int, int, int]] = []
+        with open(archive, 'rb') as f:
+            f.seek(self.manifest['offset'])
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                game = self.manifest['games']
+                try:
+                    # an invalid game is skipped as a whole, not from the invalid move
+                    hashes = list(position_hashes(parse_data(line.decode())[1], self.size))
+                    records.extend((h, game, ply) for ply, h in enumerate(hashes, 1))
+                except ValueError as e:
+                    warnings.warn('game {} of {} is skipped: {}'.format(game, archive, e))
+                self.manifest['games'] += 1
+                self.manifest['offset'] += len(line)
+                added += 1
+                if len(records) >= segment_size:
+                    self.write_segment(records)
+                    records = []
+        self.write_segment(records)
+        write_manifest(self.directory, self.manifest)
+        if len(self.manifest['segments']) > config.INDEX_SEGMENTS:
+            self.merge()
+        return added
+
+    def write_segment(self, records: List[Tuple[int, int, int]]):
+        """
+        write records into a new segment. the manifest is written by the caller
+        :param records: [hash, game, ply] of positions
+        """
+        if not records:
+            return
+        records.sort()
+        name = 'segment-{:05d}.idx'.format(self.manifest['next'])
+        self.manifest['next'] += 1
+        write_records(os.path.join(self.directory, name), records)
+        self.manifest['segments'].append({'file': name, 'records': len(records)})
+
+    def merge(self):
+        """
+        merge all segments into one
+        """
+        self.close()
+        segments = self.manifest['segments']
+        name = 'segment-{:05d}.idx'.format(self.manifest['next'])
+        self.manifest['next'] += 1
+        paths = [os.path.join(self.directory, segment['file']) for segment in segments]
+        write_records(os.path.join(self.directory, name), heapq.merge(*map(read_records, paths)))
+        self.manifest['segments'] = [{'file': name, 'records': sum(segment['records'] for segment in segments)}]
+        # old segments are removed only after the manifest doesn't know them
+        write_manifest(self.directory, self.manifest)
+        for path in paths:
+            os.remove(path)
+
+    def find(self, position: Union[Table, Iterable[Move]]) -> List[Tuple[int, int]]:
+        """
+        return games which reached the position or any of its symmetries
+        :param position: Table or moves of the position
+        :return: List[Tuple[int, int]]. [game, ply] sorted, where ply is the number of moves played
+        """
+        return self.find_hash(canonical_hash(position, self.size))
+
+    def find_hash(self, key: int) -> List[Tuple[int, int]]:
+        """
+        return games which reached the position of `canonical_hash`
+        :param key: hash of the position
+        :return: List[Tuple[int, int]]. [game, ply] sorted
+        """
+        result = []
+        for segment in self.manifest['segments']:
+            mapped = self.maps.get(segment['file'])
+            if mapped is None:
+                with open(os.path.join(self.directory, segment['file']), 'rb') as f:
+                    mapped = self.maps[segment['file']] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # the first record of `key`
+            low, high = 0, segment['records']
+            while low < high:
+                middle = (low + high) // 2
+                if RECORD.unpack_from(mapped, middle * RECORD.size)[0] < key:
+                    low = middle + 1
+                else:
+                    high = middle
+            for i in range(low, segment['records']):
+                h, game, ply = RECORD.unpack_from(mapped, i * RECORD.size)
+                if h != key:
+                    break
+                result.append((game, ply))
+        result.sort()
+        return result
+
+
+def write_records(path: str, records: Iterable[Tuple[int, int, int]]):
+    """
+    write sorted records into a segment file atomically
+    :param path: path of the segment
+    :param records: [hash, game, ply] sorted by hash
+    """
+    with open(path + '.tmp', 'wb') as f:
+        f.writelines(RECORD.pack(*record) for record in records)
+    os.replace(path + '.tmp', path)
+
+
+def read_records(path: str) -> Iterator[Tuple[int, int, int]]:
+    """
+    read records of a segment file in order
+    :param path: path of the segment
+    :return: Iterator[Tuple[int, int, int]]
+    """
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            if not chunk:
+                return
+            yield from RECORD.iter_unpack(chunk)
+
+
+def read_index(directory: str) -> dict:
+    """
+    read the manifest of an index
+    :param directory: directory of the index
+    :return: dict of `size`, `archive`, `offset` (bytes of the archive read), `games`, `next` (number of the next
+        segment) and `segments`. empty one if there is no manifest
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'size': None, 'archive': None, 'offset': 0, 'games': 0, 'next': 0, 'segments': []}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index positions of a game archive, and find games by position')
+    parser.add_argument('index', help='directory of the index')
+    parser.add_argument('--size', type=int, help='size of the table. defaults to `config.TABLE_SIZE`')
+    commands = parser.add_subparsers(dest='command', required=True)
+    update = commands.add_parser('update', help='index games appended to the archive')
+    update.add_argument('archive', help='file of a game per line in the format of data file')
+    find = commands.add_parser('find', help='print games which reached the position')
+    find.add_argument('position', help='moves of the position in the format of data file')
+    args = parser.parse_args()
+
+    with PositionIndex(args.index, args.size) as index:
+        if args.command == 'update':
+            print('indexed {} games, {} in total'.format(index.update(args.archive), index.games))
+        else:
+            for game, ply in index.find(parse_data(args.position)[1]):
+                print('game {} ply {}'.format(game, ply))
@@ -0,0 +1,399 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict
+from typing import AsyncIterator, Callable, Deque, Dict, Iterable, List, Set, Tuple, Union
+
+from analysis import Evaluation, evaluate_position
+from engine import ProtocolError, move_to_json
+from main import *
+from selfplay import GameRecord, ShardWriter, play_game
+
+Task = Tuple[str, dict]  # kind of the task and its arguments
+
+
+def record_to_json(record: GameRecord) -> dict:
+    """
+    convert GameRecord into JSON, boards in base64
+    :param record: GameRecord to convert
+    :return: dict
+    """
+    data = asdict(record)
+    data['boards'] = [base64.b64encode(board).decode() for board in record.boards]
+    return data
+
+
+def record_from_json(data: dict) -> GameRecord:
+    """
+    convert the result of `record_to_json` back into GameRecord
+    :param data: converted GameRecord
+    :return: GameRecord
+    """
+    return GameRecord(**{**data, 'boards': [base64.b64decode(board) for board in data['boards']]})
+
+
+def evaluation_to_json(evaluation: Evaluation) -> dict:
+    """
+    convert Evaluation into JSON, moves in the form of the engine protocol
+    :param evaluation: Evaluation to convert
+    :return: dict
+    """
+    return {'index': evaluation.index, 'move': evaluation.move and move_to_json(evaluation.move),
+            'score': evaluation.score, 'options': [[move_to_json(move), score] for move, score in evaluation.options],
+            'forced_win': evaluation.forced_win, 'error': evaluation.error}
+
+
+def validate_archive(name: str, data: str, size: int = None) -> dict:
+    """
+    replay a game archive in the format of data file, and check all moves are valid and nothing is played after
+    the game ended
+    :param name: name of the archive, copied to the result
+    :param data: moves in the format of data file
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :return: dict of `name`, `moves`, `valid`, `winner` (0 if not ended) and `error`
+    """
+    result = {'name': name, 'moves': 0, 'valid': False, 'winner': 0, 'error': None}
+    try:
+        _, moves = parse_data(data)
+    except ValueError as e:
+        result['error'] = str(e)
+        return result
+    result['moves'] = len(moves)
+    table = Table([], size)
+    for ply, move in enumerate(moves, 1):
+        if not table.in_table(move.point):
+            result['error'] = 'move {} is out of the table, {}'.format(ply, move)
+            return result
+        # replayed like `Table.compute`, but the ply is counted here as the same move can be repeated
+        if ply > 1 and move.program_number == moves[ply - 2].program_number:
+            if config.RAISE_ON_CSV_COUNT_ERROR:
+                result['error'] = "move {} can't be placed, {}".format(ply, move)
+                return result
+            warnings.warn('It seems like player is not playing alternately')
+        if table.compute_move(move):
+            result['error'] = "move {} can't be placed, {}".format(ply, move)
+            return result
+        if table.is_win(move.program_number, move.point):
+            if ply < len(moves):
+                result['error'] = 'moves after the win of move {}'.format(ply)
+                return result
+            result['winner'] = move.program_number
+    result['valid'] = True
+    return result
+
+
+def run_task(kind: str, args: dict) -> dict:
+    """
+    run single task on a worker
+    :param kind: `play` for `play_game`, `evaluate` for `evaluate_position` or `validate` for `validate_archive`
+    :param args: keyword arguments of the function
+    :return: dict. the result in JSON
+    """
+    if kind == 'play':
+        return record_to_json(play_game(**args))
+    if kind == 'evaluate':
+        return evaluation_to_json(evaluate_position(**args))
+    if kind == 'validate':
+        return validate_archive(**args)
+    raise ProtocolError('unknown task: {!r}'.format(kind))
+
+
+class Coordinator:
+    def __init__(self, tasks: Iterable[Task], timeout: float = None):
+        """
+        Hand out tasks to workers connected over TCP, and collect their results.
+        A worker says `{"cmd": "ready", "slots": 4}` and is sent up to `slots` tasks at once,
+        `{"task": 0, "kind": "play", "args": {...}}`, and answers each with `{"task": 0, "result": {...}}`
+        or `{"task": 0, "error": "..."}`. Tasks of a worker are put back to the queue when its connection is lost
+        or `timeout` passed without its result, and a task is done by its first result.
+        Workers are sent `{"cmd": "quit"}` when all tasks are done.
+        :param tasks: tasks to be done
+        :param timeout: seconds for a task until it is given to another worker. None for no limit
+        """
+        self.tasks: Dict[int, Task] = dict(enumerate(tasks))
+        self.timeout = timeout
+        self.queue: Deque[int] = deque(self.tasks)
+        self.deadlines: Dict[int, float] = {}  # task to the time it is sent again
+        self.done: Set[int] = set()
+        self.requeued = 0
+        self.changed = asyncio.Condition()
+        self.results: asyncio.Queue = asyncio.Queue()
+        self.connections: Set[asyncio.Task] = set()
+
+    @property
+    def finished(self) -> bool:
+        """
+        whether all tasks are done
+        """
+        return len(self.done) == len(self.tasks)
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        give tasks to a worker and read its results, until all tasks are done or the connection is lost
+        """
+        assigned: Set[int] = set()
+        sender = None
+        self.connections.add(asyncio.current_task())
+        try:
+            hello = json.loads(await reader.readline() or 'null')
+            if not isinstance(hello, dict) or hello.get('cmd') != 'ready':
+                raise ProtocolError('worker must start with ready')
+            sender = asyncio.ensure_future(self.send(writer, assigned, max(1, int(hello.get('slots', 1)))))
+            async for line in reader:
+                message = json.loads(line)
+                task = message.get('task')
+                async with self.changed:
+                    assigned.discard(task)
+                    self.finish(task, message)
+                    self.changed.notify_all()
+        except (ConnectionError, ValueError, TypeError):
+            pass
+        finally:
+            if sender is not None:
+                sender.cancel()
+            async with self.changed:
+                lost = [task for task in assigned if task not in self.done]
+                self.queue.extendleft(lost)
+                self.requeued += len(lost)
+                self.changed.notify_all()
+            writer.close()
+            self.connections.discard(asyncio.current_task())
+
+    async def send(self, writer: asyncio.StreamWriter, assigned: Set[int], slots: int):
+        """
+        send tasks to a worker whenever it has free slots
+        """
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.finished or (len(assigned) < slots and self.queue))
+                if self.finished:
+                    writer.write(b'{"cmd": "quit"}\n')
+                    break
+                while len(assigned) < slots and self.queue:
+                    task = self.queue.popleft()
+                    if task in self.done:
+                        continue
+                    assigned.add(task)
+                    if self.timeout is not None:
+                        self.deadlines[task] = time.monotonic() + self.timeout
+                    kind, args = self.tasks[task]
+                    writer.write((json.dumps({'task': task, 'kind': kind, 'args': args}) + '\n').encode())
+            await writer.drain()
+        await writer.drain()
+
+    def finish(self, task: int, message: dict):
+        """
+        record the result of a task, unless it is already done
+        """
+        if task not in self.tasks or task in self.done:
+            return
+        self.done.add(task)
+        self.deadlines.pop(task, None)
+        self.results.put_nowait((task, message.get('result'), message.get('error')))
+
+    async def watch(self):
+        """
+        put tasks which passed `timeout` back to the queue
+        """
+        while not self.finished:
+            await asyncio.sleep(min(self.timeout, 1.0))
+            now = time.monotonic()
+            async with self.changed:
+                late = [task for task, deadline in self.deadlines.items() if deadline < now and task not in self.done]
+                for task in late:
+                    del self.deadlines[task]
+                    self.queue.appendleft(task)
+                self.requeued += len(late)
+                self.changed.notify_all()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> asyncio.AbstractServer:
+        """
+        start listening for workers on TCP `host:port`
+        :return: asyncio.AbstractServer
+        """
+        if self.timeout is not None:
+            asyncio.ensure_future(self.watch())
+        return await asyncio.start_server(self.serve, host, port)
+
+    async def wait_closed(self, timeout: float = 5.0):
+        """
+        wait until workers disconnect after they are sent quit
+        :param timeout: seconds to wait
+        """
+        if self.connections:
+            await asyncio.wait(self.connections, timeout=timeout)
+
+    async def collect(self) -> AsyncIterator[Tuple[int, Union[dict, None], Union[str, None]]]:
+        """
+        yield [index of the task, result, error] of each task as soon as it is done
+        :return: AsyncIterator. result is None and error is the reason if the task failed
+        """
+        for _ in range(len(self.tasks)):
+            yield await self.results.get()
+
+
+async def work(host: str, port: int, processes: int = None, slots: int = None, executor: Executor = None):
+    """
+    connect to the coordinator and run its tasks on a pool of worker processes, until it says quit.
+    if a process of the pool dies, the pool can't run anything, so the connection is dropped and
+    the coordinator gives the tasks of this worker to others
+    :param host: host of the coordinator
+    :param port: port of the coordinator
+    :param processes: number of worker processes. defaults to the number of CPUs. 0 to run in threads
+    :param slots: how many tasks to be taken at once. defaults to the number of workers
+    :param executor: pool to run tasks on instead of a new one. shut down at the end
+    """
+    workers = processes or os.cpu_count() or 1
+    if executor is None:
+        executor = ProcessPoolExecutor(processes) if processes != 0 else ThreadPoolExecutor(workers)
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection(host, port)
+    running: Set[asyncio.Future] = set()
+
+    async def run(message: dict):
+        try:
+            result = await loop.run_in_executor(executor, run_task, message['kind'], message['args'])
+            response = {'task': message['task'], 'result': result}
+        except BrokenExecutor:
+            writer.close()
+            return
+        except Exception as e:  # raised by the task. the coordinator goes on with other tasks
+            response = {'task': message['task'], 'error': '{}: {}'.format(type(e).__name__, e)}
+        if writer.is_closing():
+            return
+        writer.write((json.dumps(response) + '\n').encode())
+        await writer.drain()
+
+    try:
+        writer.write((json.dumps({'cmd': 'ready', 'slots': slots or workers}) + '\n').encode())
+        async for line in reader:
+            message = json.loads(line)
+            if message.get('cmd') == 'quit':
+                break
+            future = asyncio.ensure_future(run(message))
+            running.add(future)
+            future.add_done_callback(running.discard)
+    finally:
+        for future in running:
+            future.cancel()
+        writer.close()
+        executor.shutdown(cancel_futures=True)
+
+
+async def coordinate(tasks: List[Task], record: Callable[[int, dict], None], host: str = '127.0.0.1', port: int = 0,
+                     timeout: float = None, local: int = 0) -> int:
+    """
+    run tasks on the workers which connect to `host:port` and pass each result to `record` as soon as it comes
+    :param tasks: tasks to be done
+    :param record: called with index of the task and its result
+    :param host: host to listen on
+    :param port: port to listen on. 0 for any free port
+    :param timeout: seconds for a task until it is given to another worker
+    :param local: how many workers to start in this process, with a process pool each
+    :return: int. how many tasks failed
+    """
+    coordinator = Coordinator(tasks, timeout)
+    server = await coordinator.start(host, port)
+    port = server.sockets[0].getsockname()[1]
+    print('{} tasks, listening on {}:{}'.format(len(tasks), host, port), flush=True)
+    workers = [asyncio.ensure_future(work(host, port)) for _ in range(local)]
+    failed = 0
+    try:
+        async for index, result, error in coordinator.collect():
+            if error is not None:
+                failed += 1
+                print('task {} failed: {}'.format(index, error), flush=True)
+                continue
+            record(index, result)
+    finally:
+        server.close()
+        await coordinator.wait_closed()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return failed
+
+
+def play_tasks(writer: ShardWriter, games: int, depth: int = 2, best: int = 3, opening: int = 4,
+               max_moves: int = None, seed: int = 0) -> List[Task]:
+    """
+    return `play` tasks of the games not written by `writer` yet, like `selfplay.generate`
+    """
+    done = writer.done
+    return [('play', {'index': index, 'depth': depth, 'best': best, 'size': writer.size, 'opening': opening,
+                      'max_moves': max_moves, 'seed': seed})
+            for index in range(games) if index not in done]
+
+
+async def main(args: argparse.Namespace):
+    if args.role == 'worker':
+        await work(args.host, args.port, args.processes, args.slots)
+        return
+
+    if args.job == 'play':
+        writer = ShardWriter(args.output, args.size or config.TABLE_SIZE, args.shard_size)
+        tasks = play_tasks(writer, args.games, args.depth, args.best, args.opening, args.max_moves, args.seed)
+        try:
+            await coordinate(tasks, lambda index, result: writer.add(record_from_json(result)), args.host,
+                             args.port, args.timeout, args.local)
+        finally:
+            writer.flush()
+        return
+
+    if args.job == 'evaluate':
+        with open(args.input) as f:
+            positions = [line.strip() for line in f if line.strip()]
+        tasks = [('evaluate', {'index': i, 'position': position, 'depth': args.depth, 'best': args.best,
+                               'size': args.size}) for i, position in enumerate(positions)]
+    else:
+        tasks = []
+        for path in args.input:
+            with open(path) as f:
+                tasks.append(('validate', {'name': path, 'data': f.read(), 'size': args.size}))
+    # results are written as they come, a JSON object per line
+    with open(args.output, 'w') as out:
+        await coordinate(tasks, lambda index, result: out.write(json.dumps(result) + '\n'), args.host, args.port,
+                         args.timeout, args.local)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run self-play, evaluation and validation on workers over TCP')
+    parser.add_argument('--host', default='127.0.0.1', help='host of the coordinator. defaults to 127.0.0.1')
+    parser.add_argument('--port', type=int, default=7100, help='port of the coordinator. defaults to 7100')
+    roles = parser.add_subparsers(dest='role', required=True)
+
+    worker = roles.add_parser('worker', help='run tasks of the coordinator')
+    worker.add_argument('--processes', type=int, help='number of worker processes. defaults to the number of CPUs')
+    worker.add_argument('--slots', type=int, help='how many tasks to be taken at once')
+
+    coordinator = roles.add_parser('coordinator', help='hand out tasks and write their results')
+    coordinator.add_argument('--timeout', type=float, help='seconds for a task until it is given to another worker')
+    coordinator.add_argument('--local', type=int, default=0, help='how many workers to start on this host')
+    coordinator.add_argument('--depth', type=int, default=2, help='depth of the search')
+    coordinator.add_argument('--best', type=int, default=3, help='width of the search')
+    coordinator.add_argument('--size', type=int, help='size of the table. defaults to `config.TABLE_SIZE`')
+    jobs = coordinator.add_subparsers(dest='job', required=True)
+
+    play = jobs.add_parser('play', help='self-play games into shards of `selfplay.ShardWriter`')
+    play.add_argument('output', help='directory of shards. generation continues if it already has shards')
+    play.add_argument('--games', type=int, default=100, help='how many games in total')
+    play.add_argument('--opening', type=int, default=4, help='how many random moves each game starts with')
+    play.add_argument('--max-moves', type=int, help='games are draws after this many moves')
+    play.add_argument('--shard-size', type=int, default=4096, help='positions per shard')
+    play.add_argument('--seed', type=int, default=0, help='seed of the openings')
+
+    evaluate = jobs.add_parser('evaluate', help='evaluate positions, a JSON object per line')
+    evaluate.add_argument('input', help='file of positions for `analysis.position_table`, one per line')
+    evaluate.add_argument('output', help='file of evaluations')
+
+    validate = jobs.add_parser('validate', help='validate game archives, a JSON object per line')
+    validate.add_argument('output', help='file of results')
+    validate.add_argument('input', nargs='+', help='archives in the format of data file')
+
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,3 +1,14 @@
 RAISE_ON_CSV_COUNT_ERROR = True
 TABLE_STARTS_WITH_ONE = True
 TABLE_SIZE = 15
+MAX_TABLE_SIZE = 100
+SEARCH_CACHE_SIZE = 100000
+STATE_SUFFIX = '.state'
+FIND_OPTIONS_CACHE_SIZE = 200000
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_COMPACT_SIZE = 256
+RANK_CANDIDATES = 10
+TIE_BREAK_SEED = 0
+SEARCH_EXTENSIONS = 2
+INDEX_SEGMENTS = 8
+WORKER_ENGINES = 64
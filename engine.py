@@ -0,0 +1,278 @@
+import json
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, Union, TextIO
+
+from main import *
+from profiling import Profiler
+
+
+class ProtocolError(ValueError):
+    """
+    raised when a command can't be executed
+    """
+
+
+MAX_SIZE = config.MAX_TABLE_SIZE  # the largest table of `new`
+
+
+def argument(command: dict, key: str, default, kind: type = int, minimum=None, maximum=None):
+    """
+    return an argument of a command, converted to `kind` and checked to be in `[minimum, maximum]`
+    :param command: parsed command
+    :param key: name of the argument
+    :param default: value if the argument isn't given
+    :param kind: int or float
+    :param minimum: the smallest valid value. None for no limit
+    :param maximum: the largest valid value. None for no limit
+    :return: the argument
+    """
+    value = command.get(key, default)
+    try:
+        if isinstance(value, bool):
+            raise TypeError()
+        converted = kind(value)
+        if kind is int and isinstance(value, float) and converted != value:
+            raise ValueError()
+        if kind is float and converted != converted:  # nan
+            raise ValueError()
+    except (TypeError, ValueError, OverflowError):
+        raise ProtocolError('{} must be {}: {!r}'.format(key, 'an integer' if kind is int else 'a number', value))
+    if (minimum is not None and converted < minimum) or (maximum is not None and converted > maximum):
+        raise ProtocolError('{} must be {}: {!r}'.format(key, 'at least {}'.format(minimum) if maximum is None else
+                                                         '{} to {}'.format(minimum, maximum), value))
+    return converted
+
+
+def move_to_json(move: Move) -> Dict[str, int]:
+    """
+    convert Move into the form of the protocol
+    :param move: Move to convert
+    :return: dict
+    """
+    return {'program_number': move.program_number,
+            'y': move.point.y + config.TABLE_STARTS_WITH_ONE,
+            'x': move.point.x + config.TABLE_STARTS_WITH_ONE}
+
+
+def move_from_json(data: Union[dict, list]) -> Move:
+    """
+    convert `{"program_number": pn, "y": y, "x": x}` or `[pn, y, x]` into Move
+    :param data: move in the form of the protocol
+    :return: Move
+    """
+    try:
+        if isinstance(data, dict):
+            program_number, y, x = data['program_number'], data['y'], data['x']
+        else:
+            program_number, y, x = data
+        move = Move(int(program_number), Point(int(y) - config.TABLE_STARTS_WITH_ONE,
+                                               int(x) - config.TABLE_STARTS_WITH_ONE))
+    except (KeyError, TypeError, ValueError):
+        raise ProtocolError('invalid move: {!r}'.format(data))
+    if move.program_number not in (1, 2):
+        raise ProtocolError('program_number must be 1 or 2: {!r}'.format(data))
+    return move
+
+
+def variation_to_json(variation: Variation) -> dict:
+    """
+    convert Variation into the form of the protocol
+    :param variation: Variation to convert
+    :return: dict
+    """
+    return {'move': move_to_json(variation.move), 'score': variation.score,
+            'pv': [move_to_json(move) for move in variation.pv],
+            'threat': variation.threat.name, 'forced_win': variation.forced_win}
+
+
+class Engine:
+    def __init__(self, size: int = None):
+        """
+        Engine which keeps a table and its caches between commands.
+        Each command is a JSON object with `cmd`, and each response is a JSON object with `ok`.
+        `id` of the command is copied to the response.
+        :param size: size of the table. defaults to `config.TABLE_SIZE`
+        """
+        self.table = Table([], size)
+        self.last_search = 0.0
+
+    def handle(self, command: dict) -> dict:
+        """
+        execute single command
+        :param command: parsed command
+        :return: response
+        """
+        try:
+            if not isinstance(command, dict):
+                raise ProtocolError('command must be an object')
+            handler = getattr(self, 'cmd_' + str(command.get('cmd')), None)
+            if handler is None:
+                raise ProtocolError('unknown command: {!r}'.format(command.get('cmd')))
+            response = {'ok': True}
+            response.update(handler(command))
+        except (ValueError, TypeError) as e:
+            # ProtocolError or bad arguments
+            response = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            # a broken command must not stop the engine
+            response = {'ok': False, 'error': 'internal error: {}: {}'.format(type(e).__name__, e)}
+        if isinstance(command, dict) and 'id' in command:
+            response['id'] = command['id']
+        return response
+
+    def cmd_new(self, command: dict) -> dict:
+        """
+        start a new game. `{"cmd": "new", "size": 15, "moves": [[pn, y, x], ...]}`. `size` and `moves` are optional.
+        """
+        size = argument(command, 'size', self.table.size, minimum=0, maximum=MAX_SIZE)
+        if 0 < size < 5:
+            raise ProtocolError('size must be 0 or at least 5: {!r}'.format(size))
+        moves = [move_from_json(move) for move in command.get('moves', [])]
+        table = Table(moves, size)
+        move, is_win = table.compute()
+        if move and not is_win:
+            raise ProtocolError("Player number {} can't place here, {}".format(move.program_number, move.point))
+        # keep caches of the previous game. positions are keyed by hash, so they never collide
+        table.cache = self.table.cache
+        self.table = table
+        return {'moves_count': table.moves_count, 'win': bool(is_win)}
+
+    def cmd_play(self, command: dict) -> dict:
+        """
+        play a move. `{"cmd": "play", "y": y, "x": x}`. `program_number` defaults to the player to move.
+        """
+        move = move_from_json({'program_number': self.table.me, **command})
+        last = self.table.moves[-1] if self.table.moves else None
+        if last and self.table.is_win(last.program_number, last.point):
+            raise ProtocolError('the game is over: {} won by {}'.format(last.program_number, last.point))
+        if not self.table.in_table(move.point):
+            raise ProtocolError('out of the table: {}'.format(move.point))
+        if self.table.compute_move(move):
+            return {'foul': True, 'win': False, 'moves_count': self.table.moves_count}
+        self.table.cache.prune(self.table.moves_count)
+        return {'foul': False, 'win': self.table.is_win(move.program_number, move.point),
+                'moves_count': self.table.moves_count}
+
+    def cmd_go(self, command: dict) -> dict:
+        """
+        search the next move. `{"cmd": "go", "depth": 3, "best": 3}` or `{"cmd": "go", "time": 1.5, "best": 3}`.
+        with `time` (in seconds), depth is deepened until the time runs out and the deepest finished search is used.
+        with `"play": true`, the chosen move is also played.
+        with `"profile": "PREFIX"`, the search is profiled and `Profiler.save` writes the report to PREFIX files.
+        `"memory": false` skips tracing allocations, which slows the search.
+        with `"multipv": 5`, the 5 best moves of `Table.choose_next_moves` are returned as `variations`.
+        `"seed": 1` changes how moves of the same score are ordered, from then on.
+        """
+        best = argument(command, 'best', 3, minimum=1)
+        program_number = argument(command, 'program_number', self.table.me, minimum=1, maximum=2)
+        multipv = argument(command, 'multipv', 0, minimum=0)
+        depth = argument(command, 'depth', 8 if 'time' in command else 3, minimum=1)
+        limit = argument(command, 'time', 1.0, float, minimum=0.0)
+        if 'time' in command and limit <= 0:
+            raise ProtocolError('time must be positive: {!r}'.format(command['time']))
+        if 'seed' in command:
+            self.table.seed = argument(command, 'seed', 0)
+        profiler = Profiler(memory=bool(command.get('memory', True))) if command.get('profile') else None
+        nodes = self.table.cache.nodes
+        if profiler:
+            profiler.start()
+        start = time.perf_counter()
+        try:
+            with profiler.search('go') if profiler else nullcontext():
+                if 'time' in command:
+                    move, oc, depth = self.search_timed(program_number, limit, best, depth)
+                else:
+                    move, oc = self.table.choose_next_move(program_number, depth, best)
+                if multipv:
+                    # the search above is in the cache
+                    variations = self.table.choose_next_moves(program_number, depth, best, multipv)
+        finally:
+            self.last_search = time.perf_counter() - start
+            if profiler:
+                profiler.stop()
+
+        response = {'move': move_to_json(move), 'score': oc.score, 'depth': depth,
+                    'nodes': self.table.cache.nodes - nodes, 'time': self.last_search}
+        if multipv:
+            response['variations'] = [variation_to_json(variation) for variation in variations]
+        if profiler:
+            response['profile'] = profiler.save(str(command['profile']))
+            response['peak'] = profiler.searches[-1][2]
+        if command.get('play'):
+            response.update(self.cmd_play(move_to_json(move)))
+        return response
+
+    def search_timed(self, program_number: int, limit: float, best: int, max_depth: int):
+        """
+        deepen `choose_next_move` until `limit` seconds passed.
+        :return: Tuple[Move, OptionContainer, depth of the result]
+        """
+        # depth 1 always finishes, so there is a move to answer
+        move, oc = self.table.choose_next_move(program_number, 1, best)
+        result = move, oc, 1
+        abort = threading.Event()
+        timer = threading.Timer(limit, abort.set)
+        timer.start()
+        self.table.abort = abort
+        try:
+            for depth in range(2, max_depth + 1):
+                move, oc = self.table.choose_next_move(program_number, depth, best)
+                result = move, oc, depth
+        except SearchAborted:
+            pass
+        finally:
+            timer.cancel()
+            self.table.abort = None
+        return result
+
+    def cmd_undo(self, command: dict) -> dict:
+        """
+        take back moves. `{"cmd": "undo", "count": 1}`
+        """
+        count = argument(command, 'count', 1, minimum=1)
+        if count > self.table.moves_count:
+            raise ProtocolError('only {} moves to undo'.format(self.table.moves_count))
+        undone = [move_to_json(self.table.undo_move()) for _ in range(count)]
+        return {'undone': undone, 'moves_count': self.table.moves_count}
+
+    def cmd_stats(self, command: dict) -> dict:
+        """
+        return state of the table and caches. `{"cmd": "stats"}`
+        """
+        return {'moves_count': self.table.moves_count, 'size': self.table.size, 'me': self.table.me,
+                'cache': self.table.cache.info(),
+                'find_options_cache': find_options_cache.info(),
+                'last_search': self.last_search}
+
+    def cmd_quit(self, command: dict) -> dict:
+        """
+        stop `run`. `{"cmd": "quit"}`
+        """
+        return {'quit': True}
+
+    def run(self, stdin: TextIO = sys.stdin, stdout: TextIO = sys.stdout):
+        """
+        read commands line by line and write responses, until `quit` or EOF
+        :param stdin: stream of commands
+        :param stdout: stream of responses
+        """
+        for line in stdin:
+            if not line.strip():
+                continue
+            try:
+                command = json.loads(line)
+            except ValueError as e:
+                response = {'ok': False, 'error': 'invalid json: {}'.format(e)}
+            else:
+                response = self.handle(command)
+            stdout.write(json.dumps(response) + '\n')
+            stdout.flush()
+            if response.get('quit'):
+                break
+
+
+if __name__ == '__main__':
+    Engine().run()
@@ -1,13 +1,115 @@
 from random import randint
-from tkinter import Tk, Button, Frame, Label, messagebox, StringVar
+from tkinter import Tk, Canvas, Frame, messagebox, Event
+from typing import Callable, Dict, Tuple, Union
 
 from main import *
 
 
+def cell_center(point: Point, cell: int, margin: int) -> Tuple[int, int]:
+    """
+    return pixel coordinates [x, y] of the intersection of `point`
+    :param point: point on the table
+    :param cell: pixels between lines
+    :param margin: pixels from the edge of the canvas to the first line
+    :return: Tuple[int, int]
+    """
+    return margin + point.x * cell, margin + point.y * cell
+
+
+def cell_at(x: float, y: float, cell: int, margin: int, size: int) -> Union[Point, None]:
+    """
+    return the point of the nearest intersection of pixel coordinates
+    :param x: x of the pixel
+    :param y: y of the pixel
+    :param cell: pixels between lines
+    :param margin: pixels from the edge of the canvas to the first line
+    :param size: size of the table
+    :return: Point. None if it is out of the table
+    """
+    point = Point(round((y - margin) / cell), round((x - margin) / cell))
+    return point if in_table(point, size) else None
+
+
+class Board(Canvas):
+    COLORS = {1: 'black', 2: 'white'}
+
+    def __init__(self, master, size: int = config.TABLE_SIZE, cell: int = 32,
+                 on_click: Callable[[Point], None] = None):
+        """
+        Table drawn on a single Canvas. Lines and labels are drawn once, and each stone is an item which is
+        created or deleted alone, so that drawing costs don't grow with the size of the table.
+        Hints are drawn over the stones and can be replaced without touching the stones.
+        :param master: parent widget
+        :param size: size of the table
+        :param cell: pixels between lines
+        :param on_click: called with the point of a click
+        """
+        self.size = size
+        self.cell = cell
+        self.margin = cell
+        length = self.margin * 2 + cell * (size - 1)
+        super().__init__(master, width=length, height=length, background='#dcb35c', highlightthickness=0)
+        self.on_click = on_click
+        self.stones: Dict[Point, int] = {}  # item of each stone
+
+        end = self.margin + cell * (size - 1)
+        for i in range(size):
+            position = self.margin + cell * i
+            self.create_line(self.margin, position, end, position)
+            self.create_line(position, self.margin, position, end)
+            self.create_text(self.margin // 2, position, text=str(i + 1))
+            self.create_text(position, self.margin // 2, text=str(i + 1))
+        self.bind('<Button-1>', self.click)
+
+    def click(self, event: Event):
+        point = cell_at(event.x, event.y, self.cell, self.margin, self.size)
+        if point is not None and self.on_click is not None:
+            self.on_click(point)
+
+    def set_stone(self, point: Point, program_number: Union[int, None]):
+        """
+        draw or remove single stone
+        :param point: point of the stone
+        :param program_number: player of the stone. None to remove
+        """
+        item = self.stones.pop(point, None)
+        if item is not None:
+            self.delete(item)
+        if program_number is not None:
+            x, y = cell_center(point, self.cell, self.margin)
+            r = self.cell * 0.45
+            self.stones[point] = self.create_oval(x - r, y - r, x + r, y + r, outline='black',
+                                                  fill=self.COLORS.get(program_number, 'gray'))
+            self.tag_raise('hint')
+
+    def show_hints(self, hints: Dict[Point, float], labels: Dict[Point, str] = None):
+        """
+        replace the overlay with squares of the points, whose colors go from blue to red by weight
+        :param hints: weight of each point in 0 to 1
+        :param labels: text on each point
+        """
+        self.clear_hints()
+        r = self.cell * 0.3
+        for point, weight in hints.items():
+            x, y = cell_center(point, self.cell, self.margin)
+            weight = min(max(weight, 0.0), 1.0)
+            color = '#{:02x}40{:02x}'.format(int(255 * weight), int(255 * (1 - weight)))
+            self.create_rectangle(x - r, y - r, x + r, y + r, fill=color, outline='', stipple='gray50', tags='hint')
+        for point, text in (labels or {}).items():
+            x, y = cell_center(point, self.cell, self.margin)
+            self.create_text(x, y, text=text, fill='black', tags='hint')
+
+    def clear_hints(self):
+        """
+        remove the overlay
+        """
+        self.delete('hint')
+
+
 class GUI(Frame):
     WIDTH = config.TABLE_SIZE
     HEIGHT = config.TABLE_SIZE
-    FONT_SIZE = 25
+    HINTS = 5
 
     def __init__(self, master=None):
         if master is None:
@@ -16,31 +118,37 @@ class GUI(Frame):
         master.title("Renju")
         self.master = master
 
-        self.buttons = [[None] * self.WIDTH for _ in range(self.HEIGHT)]
-        self.text = [[None] * self.WIDTH for _ in range(self.HEIGHT)]
-        self.labels = []
-
+        self.board = None
         self.create_widgets()
 
         self.table = Table([])
+        self.ponderer = None
         self.is_cpu_first = bool(randint(0, 1))
         self.state = 1  # 1: playing, 2: end
         if self.is_cpu_first:
             self.cpu_move()
 
     def create_widgets(self):
-        for i in range(self.HEIGHT):
-            self.labels.append(Label(self, text=str(i + 1)).grid(column=0, row=i + 1))
-            self.labels.append(Label(self, text=str(i + 1)).grid(column=i + 1, row=0))
-
-        for y in range(self.HEIGHT):
-            for x in range(self.WIDTH):
-                self.text[y][x] = StringVar()
-                self.text[y][x].set('')
-                self.buttons[y][x] = Button(self, textvariable=self.text[y][x], width=2, height=1, relief='groove',
-                                            command=self.push(y, x)).grid(column=x + 1, row=y + 1)
+        self.board = Board(self, self.WIDTH, on_click=lambda point: self.push(point.y, point.x)())
+        self.board.grid(column=0, row=0)
+        # `h` shows the best points of the player
+        self.master.bind('h', lambda event: self.show_hints())
         self.grid(column=0, row=0)
 
+    def show_hints(self):
+        """
+        overlay the best points of the player to move, by `rank_points`
+        """
+        if self.state == 2 or self.table.moves_count < 3:
+            return
+        ranking = self.table.rank_points(self.table.me)[:self.HINTS]
+        if not ranking:
+            return
+        high, low = ranking[0][0].score, ranking[-1][0].score
+        self.board.show_hints({point: 1.0 if high == low else (oc.score - low) / (high - low)
+                               for oc, point in ranking},
+                              {point: str(i + 1) for i, (oc, point) in enumerate(ranking)})
+
     def push(self, y, x):
         def wrapper():
             print('Player chose [y: {}, x: {}]'.format(y + 1, x + 1))
@@ -50,16 +158,20 @@ class GUI(Frame):
                 print("already placed")
                 messagebox.showinfo("already placed", "already placed")
                 return
+            if self.ponderer is not None:
+                self.ponderer.stop()
+                self.ponderer = None
 
             me = self.table.me
-            self.text[y][x].set(' ●○'[me])
+            self.board.clear_hints()
+            self.board.set_stone(Point(y, x), me)
             res = self.table.compute_move(Move(me, Point(y, x)))
             if res:
                 print("CPU Win(foul move)")
                 messagebox.showinfo("CPU Win(foul move)", "CPU Win(foul move)")
                 self.state = 2
 
-            if self.table.is_win(me):
+            if self.table.is_win(me, Point(y, x)):
                 print("You Win")
                 messagebox.showinfo("You Win", "You Win")
                 self.state = 2
@@ -72,12 +184,16 @@ class GUI(Frame):
     def cpu_move(self):
         move, op = self.table.choose_next_move(self.table.me, depth=2, best=3)
         print('CPU chose [y: {}, x: {}]'.format(move.point.y + 1, move.point.x + 1))
-        self.text[move.point.y][move.point.x].set(' ●○'[move.program_number])
+        self.board.set_stone(move.point, move.program_number)
         self.table.compute_move(move)
-        if self.table.is_win(move.program_number):
+        self.table.cache.prune(self.table.moves_count)
+        if self.table.is_win(move.program_number, move.point):
             print("CPU Win")
             messagebox.showinfo("CPU Win", "CPU Win")
             self.state = 2
+            return
+        # think while the player is thinking
+        self.ponderer = Ponderer(self.table, move.program_number, depth=2, best=3).start()
 
 
 if __name__ == '__main__':
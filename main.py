@@ -1,15 +1,26 @@
+import argparse
+import hashlib
+import json
 import os
-import random
 import sys
+import threading
 import warnings
-from collections import defaultdict
+import zlib
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass
 from enum import Enum
+import itertools
 from itertools import chain
-from typing import List, Union, Dict, Tuple
+from typing import Iterable, List, Union, Dict, Tuple
 
 import config
 
+try:
+    import fcntl
+except ImportError:  # no locks between writers of a journal on Windows
+    fcntl = None
+
 
 class OptionType(Enum):
     Win = 5  # already won
@@ -158,10 +169,8 @@ class OptionContainer:
         return result
 
     def __lt__(self, other: 'OptionContainer'):
-        me, op = self.score, other.score
-        if me - op:
-            return me < op
-        return random.choice((True, False))
+        # ties are kept in order. `Table` sorts points by `tie_break` of them
+        return self.score < other.score
 
     def __repr__(self):
         return 'OptionContainer(options={!r})'.format(self.options)
@@ -181,6 +190,64 @@ class Point:
         return False
 
 
+def zobrist(point: Point, program_number: int) -> int:
+    """
+    return 64bit zobrist key of a stone. computed from its coordinates, so it doesn't depend on the table size.
+    :param point: point of the stone
+    :param program_number: player who placed the stone
+    :return: int. key to xor into the hash of table
+    """
+    key = _ZOBRIST_KEYS.get((point, program_number))
+    if key is None:
+        # splitmix64
+        z = ((point.y & 0xffff) << 40 | (point.x & 0xffff) << 16 | program_number & 0xffff) + 0x9e3779b97f4a7c15
+        z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+        z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+        key = _ZOBRIST_KEYS[(point, program_number)] = z ^ (z >> 31)
+    return key
+
+
+_ZOBRIST_KEYS: Dict[Tuple[Point, int], int] = {}
+
+
+def tie_break(point: Point, seed: int) -> int:
+    """
+    return key to order points of the same score. the order is fixed for each seed
+    :param point: point to be ordered
+    :param seed: seed of the order
+    :return: int
+    """
+    return zobrist(point, 0) ^ (seed * 0x9e3779b97f4a7c15 & 0xffffffffffffffff)
+
+
+UNBOUNDED = 0  # size of the table without edges
+
+
+def in_table(point: Point, size: int) -> bool:
+    """
+    return whether point is inside of the table
+    :param point: point to check
+    :param size: size of the table. `UNBOUNDED` for the unbounded table
+    :return: bool
+    """
+    return not size or (0 <= point.y < size and 0 <= point.x < size)
+
+
+def label(number: int) -> str:
+    """
+    return label of row or column for `Table.pretty_print`. the width is same as '・'
+    :param number: number to be shown
+    :return: str
+    """
+    if 1 <= number <= 20:
+        return chr(0x2460 + number - 1)  # ①-⑳
+    if 21 <= number <= 35:
+        return chr(0x3251 + number - 21)  # ㉑-㉟
+    if 36 <= number <= 50:
+        return chr(0x32b1 + number - 36)  # ㊱-㊿
+    return '{:>2}'.format(number)
+
+
 class Direction(Enum):
     Horizontal = (0, 1)  # →
     Vertical = (1, 0)  # ↓
@@ -188,6 +255,166 @@ class Direction(Enum):
     Diagonal_UR_BL = (1, -1)  # ↙
 
 
+# (dy, dx) of each Direction, to avoid looking up `Direction.value` in hot loops
+_DIRECTIONS = tuple(direction.value for direction in Direction)
+
+
+def _steps(y: int, x: int, dy: int, dx: int, size: int) -> int:
+    """
+    return how many cells are from (y, x) to the edge of the table toward (dy, dx), not including (y, x)
+    """
+    return min(size - 1 - v if d > 0 else v for v, d in ((y, dy), (x, dx)) if d)
+
+
+def cell_rays(point: Point, size: int) -> Iterable[Tuple[Iterable[Point], Iterable[Point]]]:
+    """
+    return [cells toward `Line.first`, cells toward `Line.second`] from the next of `point` to the edge,
+    for each Direction, the nearest first. computed once for each cell of the table
+    :param point: start point. not included
+    :param size: size of the table. `UNBOUNDED` for the unbounded table
+    :return: Iterable. rays are endless for the unbounded table, and empty if `point` is out of the table
+    """
+    y, x = point.y, point.x
+    if size:
+        key = (size, y, x)
+        result = _CELL_RAYS.get(key)
+        if result is None:
+            if not (0 <= y < size and 0 <= x < size):
+                return (((), ()),) * 4
+            result = _CELL_RAYS[key] = tuple(
+                tuple(tuple(Point(y + sy * i, x + sx * i) for i in range(1, _steps(y, x, sy, sx, size) + 1))
+                      for sy, sx in ((-dy, -dx), (dy, dx)))
+                for dy, dx in _DIRECTIONS)
+        return result
+    return [(map(Point, itertools.count(y - dy, -dy), itertools.count(x - dx, -dx)),
+             map(Point, itertools.count(y + dy, dy), itertools.count(x + dx, dx)))
+            for dy, dx in _DIRECTIONS]
+
+
+_CELL_RAYS: Dict[Tuple[int, int, int], Tuple[Tuple[Tuple[Point, ...], Tuple[Point, ...]], ...]] = {}
+_DIRECTION_INDEX = {direction: i for i, direction in enumerate(Direction)}
+
+
+def ray(point: Point, direction: Direction, forward: bool, size: int) -> Iterable[Point]:
+    """
+    return cells from the next of `point` to the edge of the table
+    :param point: start point. not included
+    :param direction: direction of the ray
+    :param forward: toward `Line.second` if True, toward `Line.first` otherwise
+    :param size: size of the table. `UNBOUNDED` for the unbounded table
+    :return: Iterable[Point]. endless for the unbounded table, and empty if `point` is out of the table
+    """
+    if size:
+        return cell_rays(point, size)[_DIRECTION_INDEX[direction]][forward]
+    dy, dx = direction.value
+    if not forward:
+        dy, dx = -dy, -dx
+    return map(Point, itertools.count(point.y + dy, dy), itertools.count(point.x + dx, dx))
+
+
+def window_rays(point: Point, size: int) -> Tuple[Tuple[Tuple[Point, ...], Tuple[Point, ...], Tuple[Point, ...]], ...]:
+    """
+    return 5 cells toward `Line.first` from the farthest, 5 cells toward `Line.second` from the nearest,
+    and cells within 2 cells, for each Direction. cut at the edge of the table. computed once for each cell
+    :param point: center point. not included
+    :param size: size of the table. `UNBOUNDED` for the unbounded table
+    :return: tuple. [cells toward `Line.first`, cells toward `Line.second`, near cells] of each Direction
+    """
+    key = (size, point.y, point.x)
+    result = _WINDOW_RAYS.get(key)
+    if result is None:
+        if size:
+            sides = [(back[4::-1], forward[:5]) for back, forward in cell_rays(point, size)]
+        else:
+            y, x = point.y, point.x
+            sides = [(tuple(Point(y - dy * i, x - dx * i) for i in range(5, 0, -1)),
+                      tuple(Point(y + dy * i, x + dx * i) for i in range(1, 6)))
+                     for dy, dx in _DIRECTIONS]
+        result = _WINDOW_RAYS[key] = tuple((back, forward, back[-2:] + forward[:2]) for back, forward in sides)
+    return result
+
+
+_WINDOW_RAYS: Dict[Tuple[int, int, int], tuple] = {}
+
+
+def _window_run(window: Tuple[int, ...]) -> int:
+    """
+    return length of the black run through the center of `window`
+    """
+    low = high = 5
+    while low and window[low - 1] == 1:
+        low -= 1
+    while high < 10 and window[high + 1] == 1:
+        high += 1
+    return high - low + 1
+
+
+def _window_fives(window: Tuple[int, ...]) -> List[int]:
+    """
+    return indexes of empty cells of `window` where black makes exactly five through the center
+    """
+    return [i for i in range(1, 10) if window[i] == 0 and _window_run(window[:i] + (1,) + window[i + 1:]) == 5]
+
+
+def foul_window(window: Tuple[int, ...]) -> Tuple[bool, bool, int, Tuple[int, ...]]:
+    """
+    classify the black stone at the center of `window`, 11 cells of a Direction from `Line.first` side.
+    cells are 1 for black, 0 for empty and 2 for white or out of the table. computed once for each window.
+    a four has a cell to make exactly five, and a straight four has two of them, which counts as one four.
+    a three has a cell to make a straight four. it is real only if that cell isn't foul, so it is left to the table.
+    :param window: cells at offsets -5 to 5 from the stone
+    :return: [makes five, makes overline, number of fours, offsets of cells which make a straight four]
+    """
+    result = _FOUL_WINDOWS.get(window)
+    if result is None:
+        run = _window_run(window)
+        fives = _window_fives(window)
+        fours = 1 if len(fives) == 2 and fives[1] - fives[0] == 5 else len(fives)
+        threes = ()
+        if not fours:
+            threes = []
+            for i in range(1, 10):
+                if window[i] == 0:
+                    fives_after = _window_fives(window[:i] + (1,) + window[i + 1:])
+                    if len(fives_after) == 2 and fives_after[1] - fives_after[0] == 5:
+                        threes.append(i - 5)
+            threes = tuple(threes)
+        result = _FOUL_WINDOWS[window] = (run == 5, run > 5, fours, threes)
+    return result
+
+
+_FOUL_WINDOWS: Dict[Tuple[int, ...], Tuple[bool, bool, int, Tuple[int, ...]]] = {}
+
+
+def pattern_window(window: Tuple[int, ...]) -> Tuple[int, bool]:
+    """
+    score the stone at the center of `window` by 5-cell windows through it, which can still be five.
+    cells are same as `foul_window`, for either player. computed once for each window.
+    it is a threat if it makes four or five, or an open three which may be split.
+    :param window: cells at offsets -5 to 5 from the stone
+    :return: [score, whether it is a threat]
+    """
+    result = _PATTERN_WINDOWS.get(window)
+    if result is None:
+        score = 0
+        threat = False
+        for start in range(1, 6):
+            cells = window[start:start + 5]
+            if 2 not in cells:
+                stones = cells.count(1)
+                score += 4 ** stones
+                threat = threat or stones >= 4
+        for start in range(1, 5):
+            # _XXX_, _XX_X_ and _X_XX_
+            cells = window[start:start + 6]
+            threat = threat or (cells[0] == cells[5] == 0 and 2 not in cells and cells.count(1) == 3)
+        result = _PATTERN_WINDOWS[window] = (score, threat)
+    return result
+
+
+_PATTERN_WINDOWS: Dict[Tuple[int, ...], Tuple[int, bool]] = {}
+
+
 @dataclass
 class Line:
     """
@@ -213,34 +440,29 @@ class Line:
                                                                                                     self.first,
                                                                                                     self.second))
 
-    def extend_first(self) -> Union[Tuple['Line', Point, bool], Tuple[None, None, bool]]:
+    def extend_first(self, size: int = None) -> Union[Tuple['Line', Point, bool], Tuple[None, None, bool]]:
         """
         return line extended in the `first` point direction.
+        :param size: size of the table. defaults to `config.TABLE_SIZE`. `UNBOUNDED` for the unbounded table
         :return: [extended_Line, extended_point, whether extended successful]
         """
-        dy, dx = self.direction.value
-        next_y = self.first.y - dy
-        next_x = self.first.x - dx
-
-        if not 0 <= next_x < config.TABLE_SIZE or not 0 <= next_y < config.TABLE_SIZE:
+        new_point = next(iter(ray(self.first, self.direction, False, config.TABLE_SIZE if size is None else size)),
+                         None)
+        if new_point is None:
             return None, None, False
 
-        new_point = Point(next_y, next_x)
         return Line(self.direction, new_point, self.second, self.program_number), new_point, True
 
-    def extend_second(self) -> Union[Tuple['Line', Point, bool], Tuple[None, None, bool]]:
+    def extend_second(self, size: int = None) -> Union[Tuple['Line', Point, bool], Tuple[None, None, bool]]:
         """
         return line extended in the `second` point direction.
+        :param size: size of the table. defaults to `config.TABLE_SIZE`. `UNBOUNDED` for the unbounded table
         :return: [extended_Line, extended_point, whether extended successful]
         """
-
-        dy, dx = self.direction.value
-        next_y = self.second.y + dy
-        next_x = self.second.x + dx
-
-        if not 0 <= next_x < config.TABLE_SIZE or not 0 <= next_y < config.TABLE_SIZE:
+        new_point = next(iter(ray(self.second, self.direction, True, config.TABLE_SIZE if size is None else size)),
+                         None)
+        if new_point is None:
             return None, None, False
-        new_point = Point(next_y, next_x)
 
         return Line(self.direction, self.first, new_point, self.program_number), new_point, True
 
@@ -269,29 +491,164 @@ class Move:
     point: Point
 
 
+@dataclass
+class Variation:
+    """
+    One of the best moves of `Table.choose_next_moves`
+    :param move: move to play
+    :param score: score of the move. the higher, the better for the player
+    :param pv: principal variation, `move` and the expected moves after it
+    :param threat: the best type of options the move makes
+    :param forced_win: whether the player wins whatever the opponent does after the move
+    """
+    move: Move
+    score: int
+    pv: List[Move]
+    threat: OptionType
+    forced_win: bool
+
+
+class SearchAborted(Exception):
+    """
+    raised inside of `Table.choose_next_move` when the search was asked to stop
+    """
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        """
+        Dict-like cache which drops the least recently used entries when it holds more than `maxsize` entries.
+        Counts hits and misses of `get`.
+        :param maxsize: how many entries to keep
+        """
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple):
+        """
+        return stored value and mark it as recently used
+        :param key: key of the value
+        :return: stored value or None
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value):
+        """
+        store value
+        :param key: key of the value
+        :param value: value to store. None can't be stored
+        """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        return ratio of hits in all `get`
+        :return: float. 0 if never used
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def info(self) -> Dict[str, Union[int, float]]:
+        """
+        return counters to be reported
+        :return: dict
+        """
+        return {'entries': len(self), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate}
+
+    def clear(self):
+        """
+        drop all entries and counters
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SearchCache(LRUCache):
+    def __init__(self, maxsize: int = None):
+        """
+        Results of `Table.choose_next_move` keyed by `Table.search_key`, shared by a table and all of its copies.
+        :param maxsize: how many results to keep. defaults to `config.SEARCH_CACHE_SIZE`
+        """
+        super().__init__(config.SEARCH_CACHE_SIZE if maxsize is None else maxsize)
+        self.nodes = 0  # searches not found in the cache
+        self.evaluations = 0  # points scored by `Table.score_point`
+
+    def prune(self, moves_count: int):
+        """
+        drop results of positions before `moves_count` moves. they can't appear again in this game.
+        :param moves_count: moves count of the current table
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[1] < moves_count]:
+                del self.entries[key]
+
+    def info(self) -> Dict[str, Union[int, float]]:
+        info = super().info()
+        info['nodes'] = self.nodes
+        info['evaluations'] = self.evaluations
+        return info
+
+    def clear(self):
+        super().clear()
+        self.nodes = self.evaluations = 0
+
+
+# results of `Table.find_options` keyed by `Table.find_options_key`, shared by all tables
+find_options_cache = LRUCache(config.FIND_OPTIONS_CACHE_SIZE)
+
+
 class Table:
     moves: List[Move]
     table: Dict[Point, Union[None, int]]  # point to program_number. if not set, return None
 
-    def __init__(self, moves: List[Move]):
+    def __init__(self, moves: List[Move], size: int = None):
         """
         Table of Renju
         :param moves: All moves
+        :param size: size of the table. defaults to `config.TABLE_SIZE`. `UNBOUNDED` for the unbounded table
 
         :var
         """
         self.moves_count = len(moves)
         self.moves = moves
+        self.size = config.TABLE_SIZE if size is None else size
 
         self.table: Dict[Point, Union[None, int]] = defaultdict(lambda: None)
-
-    def compute(self) -> Union[Tuple[None, None], Tuple[Move, bool]]:
+        self.hash = 0  # zobrist hash of `table`
+        self.cache = SearchCache()  # shared with copies
+        self.abort: Union[threading.Event, None] = None  # stop the search when set
+        self.seed = config.TIE_BREAK_SEED  # seed of `tie_break` between points of the same score
+        self.fouls: Dict[Point, bool] = {}  # results of `black_foul` while `hash` is `fouls_hash`
+        self.fouls_hash = 0
+
+    def compute(self, start: int = 0) -> Union[Tuple[None, None], Tuple[Move, bool]]:
         """
         Compute all moves and update table. If there is any foul move or win move, return it
+        :param start: how many moves are already computed and placed on the table
         :return: [Move, is_win] if foul move or Win move is there. Otherwise, [None, None]
         """
-        prev = None
-        for move in self.moves:
+        prev = self.moves[start - 1].program_number if start else None
+        for move in self.moves[start:]:
             if move.program_number == prev:
                 if config.RAISE_ON_CSV_COUNT_ERROR:
                     return move, False
@@ -299,19 +656,23 @@ class Table:
             prev = move.program_number
             if self.check_foul(move):
                 return move, False
-            self.table[move.point] = move.program_number
+            self.place(move)
 
-            if self.is_win(move.program_number):
+            if self.is_win(move.program_number, move.point):
                 return move, True
 
         return None, None
 
-    def is_win(self, program_number: int) -> bool:
+    def is_win(self, program_number: int, point: Point = None) -> bool:
         """
         return whether program_number is already won
         :param program_number: program_number check to
+        :param point: the last placed stone. if given, only lines through it are checked
         :return: bool
         """
+        if point is not None:
+            return self.table.get(point) == program_number and self.makes_five(Move(program_number, point))
+
         is_black = self.is_black(program_number)
 
         lines = self.get_lines(program_number)
@@ -328,11 +689,33 @@ class Table:
         """
         if self.check_foul(move):
             return True
-        self.table[move.point] = move.program_number
+        self.place(move)
         self.moves.append(move)
         self.moves_count += 1
         return False
 
+    def undo_move(self) -> Move:
+        """
+        take back the last move
+        :return: Move taken back
+        """
+        if not self.moves:
+            raise ValueError('there is no move to undo')
+        move = self.moves.pop()
+        self.moves_count -= 1
+        if self.table.get(move.point) == move.program_number:
+            del self.table[move.point]
+            self.hash ^= zobrist(move.point, move.program_number)
+        return move
+
+    def place(self, move: Move):
+        """
+        put the stone of `move` on the table without any check. `moves` is not updated.
+        :param move: Move to place
+        """
+        self.table[move.point] = move.program_number
+        self.hash ^= zobrist(move.point, move.program_number)
+
     def check_foul(self, move: Move) -> bool:
         """
         Check if the move is foul
@@ -344,32 +727,10 @@ class Table:
             # already placed
             return True
 
-        is_black = self.is_black(move.program_number)
-
-        if not is_black:
-            # white has no foul moves
+        if not self.moves_count or not self.is_black(program_number):
+            # white and the first move have no foul moves
             return False
-
-        new = [0, 0, 0, 0, 0, 0, 0, 0]
-        for direction in Direction:
-            line = Line(direction, move.point, move.point, program_number)
-            l, p, s = line.extend_first()
-            if s and p in self.table and self.table[p] == program_number:  # extendable and already placed there
-                l, p, s = self.line_extend_first(line, False)  # then connect with it
-                if s:
-                    line = l
-            l, p, s = line.extend_second()
-            if s and p in self.table and self.table[p] == program_number:
-                l, p, s = self.line_extend_second(line, False)
-                if s:
-                    line = l
-            new[line.length - 1] += 1
-
-        if new[4]:  # 5 length line is win
-            return False
-        if any(new[5:]):  # cho-ren
-            return True
-        return new[3] >= 2 or new[2] >= 2  # san-san or shi-shi
+        return self.black_foul(move.point)
 
     def get_lines(self, program_number: int) -> Dict[int, List[Line]]:
         """
@@ -388,16 +749,14 @@ class Table:
 
             while points_copy:  # if any point is not used
                 first = second = points_copy.pop()  # create 1 length line
-                while True:
-                    next_first = Point(first.y - direction.value[0], first.x - direction.value[1])
+                for next_first in ray(first, direction, False, self.size):
                     if next_first not in points_copy:
                         break
 
                     # extend if line is extendable
                     points_copy.remove(next_first)
                     first = next_first
-                while True:
-                    next_second = Point(second.y + direction.value[0], second.x + direction.value[1])
+                for next_second in ray(second, direction, True, self.size):
                     if next_second not in points_copy:
                         break
 
@@ -408,61 +767,94 @@ class Table:
 
         return result
 
-    def choose_next_move(self, program_number: int, depth=1, best=5) -> Tuple[Move, OptionContainer]:
+    def search_key(self, program_number: int, depth: int, best: int, extensions: int = None) -> tuple:
+        """
+        return key of `SearchCache` for the search of this position
+        :param program_number: Compute as
+        :param depth: depth of the search
+        :param best: width of the search
+        :param extensions: extensions left for the search
+        :return: tuple. hashable key
+        """
+        return (self.hash, self.moves_count, self.moves[0].program_number if self.moves else None, program_number,
+                depth, best, self.size, self.seed, extensions)
+
+    def choose_next_move(self, program_number: int, depth=1, best=5, extensions: int = None) \
+            -> Tuple[Move, OptionContainer]:
         """
         calculate the best move and return OptionContainer for the recursive calc.
+        results are stored in `cache`, so searching the same position again (e.g. pondered one) is free.
+        a forcing move (four or open three) and the reply to it don't count against `depth`, up to `extensions`
+        times in a line, and quiet moves besides the best one are searched 2 plies shallower.
         :param program_number: Compute as
         :param depth: how many times to calculate recursively
         :param best: for each recurrence, how many of the best should be computed
+        :param extensions: how many forcing moves can extend a line. defaults to `config.SEARCH_EXTENSIONS`
         :return: Tuple[Move, Union[OptionContainer, None]]
         """
+        self.check_abort()
+        if extensions is None:
+            extensions = config.SEARCH_EXTENSIONS
+
+        key = self.search_key(program_number, depth, best, extensions)
+        result = self.cache.get(key)
+        if result is None:
+            self.cache.nodes += 1
+            result = self._choose_next_move(program_number, depth, best, extensions)
+            self.cache.put(key, result)
+        return result
+
+    def _choose_next_move(self, program_number: int, depth: int, best: int, extensions: int) \
+            -> Tuple[Move, OptionContainer]:
+        """
+        body of `choose_next_move` without cache
+        """
+        center = self.center
         if self.moves_count == 0:
             # place to center
-            return Move(program_number, Point(7, 7)), OptionContainer()
+            return Move(program_number, center), OptionContainer()
 
         if self.moves_count == 1:
-            if Point(7, 7) not in self.table is None:
+            if center not in self.table:
                 # if black haven't placed to center
-                return Move(program_number, Point(7, 7)), OptionContainer()
+                return Move(program_number, center), OptionContainer()
 
             for i in range(9):
                 # any around
-                y, x = 7 + (i % 3 - 1), 7 + (i // 3 - 1)
-                if y in range(0, config.TABLE_SIZE) and x in range(0, config.TABLE_SIZE) and i != 4:
-                    return Move(program_number, Point(y, x)), OptionContainer()
+                point = Point(center.y + (i % 3 - 1), center.x + (i // 3 - 1))
+                if self.in_table(point) and point not in self.table and i != 4:
+                    return Move(program_number, point), OptionContainer()
         if self.moves_count == 2:
             for i in range(9):
                 # any around of 2 block distant
-                y, x = 7 + (i % 3 - 1) * 2, 7 + (i // 3 - 1) * 2
-                if y in range(0, config.TABLE_SIZE) and x in range(0, config.TABLE_SIZE) and i != 4:
-                    return Move(program_number, Point(y, x)), OptionContainer()
+                point = Point(center.y + (i % 3 - 1) * 2, center.x + (i // 3 - 1) * 2)
+                if self.in_table(point) and point not in self.table and i != 4:
+                    return Move(program_number, point), OptionContainer()
+
+        forced = self.find_forced_move(program_number)
+        if forced:
+            # no need to score all candidates
+            return forced
 
         opponent = self.opponent(program_number)
 
         scores: List[List[List[OptionContainer, Point]], List[List[OptionContainer, Point]]] = [[], []]
 
-        for pn, es in [(program_number, scores[0]), (opponent, scores[1])]:
-            available_points = self.available_extended_points(pn, 2)
-            for point in available_points:
-                # for each point available, calc score of condition when program_number placed there
-                table = self.copy()
-                table.compute_move(Move(pn, point))
-                oc = OptionContainer()
-                for line in chain.from_iterable(table.get_lines(pn).values()):
-                    _oc = table.find_options(line)
-                    if _oc.max.type == OptionType.Win:
-                        # if winnable as myself, use this move
-                        #   OR
-                        # if there is a point which if enemy place there and they will win,
-                        # place there if it's not foul
-                        if pn == program_number or not self.check_foul(Move(program_number, point)):
-                            return Move(program_number, point), OptionContainer()
-                    oc = oc.add(_oc)
-                oc.options.sort(key=lambda v: v.type.priority)
-                es.append([oc, point])
-            es.sort(reverse=True)
-
-        win_to, points = [999, 999], [None, None]
+        for i, pn in enumerate([program_number, opponent]):
+            # for each point available, calc score of condition when program_number placed there
+            scores[i] = self.rank_points(pn)
+            for oc, point in scores[i]:
+                if oc.max.type == OptionType.Win:
+                    # if winnable as myself, use this move
+                    #   OR
+                    # if there is a point which if enemy place there and they will win,
+                    # place there if it's not foul
+                    if pn == program_number:
+                        return Move(program_number, point), oc
+                    if not self.check_foul(Move(program_number, point)):
+                        return Move(program_number, point), OptionContainer()
+
+        win_to, points, ocs = [999, 999], [None, None], [None, None]
         for i in range(2):
             if any(ev[0].winnable_with_skip for ev in scores[i]):
                 # if there are any options enemy winnable
@@ -474,37 +866,431 @@ class Table:
                         if _win_to < win_to[i]:
                             win_to[i] = _win_to
                             points[i] = _point
+                            ocs[i] = ev
 
         if win_to[1] != 999:
             if win_to[1] < win_to[0]:  # enemy will win first
                 return Move(program_number, points[1]), OptionContainer()
             # player can win earlier
-            return Move(program_number, points[0]), OptionContainer()
+            return Move(program_number, points[0]), ocs[0]
         if win_to[0] != 999:
             # can will
-            return Move(program_number, points[0]), OptionContainer()
+            return Move(program_number, points[0]), ocs[0]
 
         if depth <= 1:
             ow, point = scores[0][0]
             return Move(program_number, point), ow
 
+        diff = self.search_children(program_number, scores[0][:best], depth, best, extensions)
+        diff.sort(key=lambda item: (item[0], -tie_break(item[4], self.seed)))
+        return Move(program_number, diff[0][4]), diff[0][1] or OptionContainer()
+
+    def search_children(self, program_number: int, candidates: List[List[Union[OptionContainer, Point]]],
+                        depth: int, best: int, extensions: int) -> List[list]:
+        """
+        search the best reply of the opponent to each candidate, as the root of `choose_next_move` does.
+        the replies are keyed in `cache` by the index of the candidate, so pass candidates in the order of
+        `rank_points` to reuse the search.
+        :param program_number: Compute as
+        :param candidates: [OptionContainer, Point] of `rank_points`
+        :param depth: depth of the search from the candidates
+        :param best: for each recurrence below the candidates, how many of the best should be computed
+        :param extensions: how many forcing moves can extend a line
+        :return: List of [score of the opponent - score, OptionContainer, reply OptionContainer, reply, Point].
+            not sorted. the reply is None if depth is 1
+        """
+        opponent = self.opponent(program_number)
         diff = []
-        for ow, point in scores[0][:best]:
+        for i, (ow, point) in enumerate(candidates):
+            if depth <= 1:
+                diff.append([-ow.score, ow, OptionContainer(), None, point])
+                continue
             table = self.copy()
             table.compute_move(Move(program_number, point))
+            threat = ow.max.type
+            if extensions and threat in (OptionType.Checkmate, OptionType.ToCheckmate):
+                # the reply is forced, so the line goes on at the same depth
+                enemy_move, enemy_choice = table.choose_next_move(opponent, depth - 1, best, extensions - 1)
+                score = ow.score
+                if not table.compute_move(enemy_move) and not table.is_win(opponent, enemy_move.point):
+                    score = max(score, table.choose_next_move(program_number, depth, best, extensions - 1)[1].score)
+                diff.append([enemy_choice.score - score, ow, enemy_choice, enemy_move, point])
+                continue
             # for each point, compute opponents move recursively and take the best one
-            enemy_move, enemy_choice = self.choose_next_move(self.opponent(program_number), depth - 1, best)
+            reduced = i and depth > 2 and threat in (OptionType.Preferable, OptionType.Trash)
+            enemy_move, enemy_choice = table.choose_next_move(opponent, depth - 2 if reduced else depth - 1, best,
+                                                              extensions)
             diff.append([enemy_choice.score - ow.score, ow, enemy_choice, enemy_move, point])
+        return diff
 
-        diff.sort()
-        return Move(program_number, diff[0][4]), diff[0][1] or OptionContainer()
+    def choose_next_moves(self, program_number: int, depth=1, best=5, count=5, extensions: int = None) \
+            -> List[Variation]:
+        """
+        calculate the `count` best moves by the search of `choose_next_move`. the candidates searched at its root
+        are taken from `cache`, and the other candidates are searched the same way, so all of them are scored by
+        the best reply of the opponent. they are sorted like the root of the search, and the move of
+        `choose_next_move` is the first of the same score. so it is the first one, unless it is chosen without
+        the search like an opening move.
+        :param program_number: Compute as
+        :param depth: how many times to calculate recursively
+        :param best: for each recurrence below the root, how many of the best should be computed
+        :param count: how many moves to be returned
+        :param extensions: how many forcing moves can extend a line. defaults to `config.SEARCH_EXTENSIONS`
+        :return: List[Variation]. the best first
+        """
+        if extensions is None:
+            extensions = config.SEARCH_EXTENSIONS
+        move, _ = self.choose_next_move(program_number, depth, best, extensions)
+        candidates = list(self.rank_points(program_number)[:max(count, best)])
+        if move.point not in [point for _, point in candidates]:
+            # chosen without scoring candidates. e.g. an opening move or a forced block
+            candidates.append([self.score_point(program_number, move.point), move.point])
+
+        children = self.search_children(program_number, candidates, depth, best, extensions)
+        children.sort(key=lambda item: (item[0], item[4] != move.point, -tie_break(item[4], self.seed)))
+        return [self.variation(program_number, child, depth, best, extensions) for child in children[:count]]
+
+    def variation(self, program_number: int, child: list, depth: int, best: int, extensions: int = None) \
+            -> Variation:
+        """
+        follow the best moves after a candidate searched by `search_children`
+        :param program_number: Compute as
+        :param child: result of `search_children` for the candidate
+        :param depth: depth of the search from the candidate
+        :param best: best of `choose_next_move` of the moves after it
+        :param extensions: extensions of `choose_next_move` of the moves after it.
+            defaults to `config.SEARCH_EXTENSIONS`
+        :return: Variation
+        """
+        diff, oc, _, reply, point = child
+        table = self.copy()
+        pv = [Move(program_number, point)] + ([] if reply is None else [reply])
+        ended = any(table.compute_move(move) or table.is_win(move.program_number, move.point) for move in pv)
+        while not ended and len(pv) < depth:
+            move = table.choose_next_move(table.opponent(pv[-1].program_number), depth - len(pv), best, extensions)[0]
+            pv.append(move)
+            ended = table.compute_move(move) or table.is_win(move.program_number, move.point)
+        return Variation(pv[0], -diff, pv, oc.max.type, oc.winnable_with_skip)
+
+    def run_length(self, move: Move, direction: Direction) -> int:
+        """
+        return length of the contiguous line through `move.point` in `direction`, as if `move` is placed
+        :param move: Move to be counted
+        :param direction: direction to count
+        :return: int. length
+        """
+        length = 1
+        for forward in (False, True):
+            for point in ray(move.point, direction, forward, self.size):
+                if self.table.get(point) != move.program_number:
+                    break
+                length += 1
+        return length
+
+    def run_lengths(self, point: Point, program_number: int) -> List[int]:
+        """
+        return `run_length` of each Direction at once
+        :param point: point to be counted
+        :param program_number: Compute as
+        :return: List[int]. lengths in the order of Direction
+        """
+        lengths = []
+        for cells in cell_rays(point, self.size):
+            length = 1
+            for side in cells:
+                for next_point in side:
+                    if self.table.get(next_point) != program_number:
+                        break
+                    length += 1
+            lengths.append(length)
+        return lengths
+
+    def makes_five(self, move: Move) -> bool:
+        """
+        return whether `move` makes five. exactly five for black.
+        :param move: Move to be judged
+        :return: bool
+        """
+        lengths = self.run_lengths(move.point, move.program_number)
+        return 5 in lengths or (max(lengths) > 5 and not self.is_black(move.program_number))
+
+    def five_points(self, point: Point, program_number: int) -> List[Point]:
+        """
+        return empty points which make five with the stone at `point`
+        :param point: point of the stone of `program_number`
+        :param program_number: Compute as
+        :return: List[Point]
+        """
+        result = []
+        for dy, dx in _DIRECTIONS:
+            # 9 cells centered on `point`, read once for the 5 windows
+            cells = [Point(point.y + dy * i, point.x + dx * i) for i in range(-4, 5)]
+            numbers = [self.table.get(p) for p in cells]
+            for start in range(5):
+                # each 5-length window which contains `point`
+                window = numbers[start:start + 5]
+                if window.count(program_number) != 4 or None not in window:
+                    continue
+                p = cells[start + window.index(None)]
+                if self.in_table(p) and p not in result and self.makes_five(Move(program_number, p)):
+                    result.append(p)
+        return result
+
+    def find_forced_move(self, program_number: int, recent: int = 3) -> Union[Tuple[Move, OptionContainer], None]:
+        """
+        look for a move which must be played, only around the last moves of each player.
+        in order of five, blocking opponent's five, and four which can't be stopped (open four or double four).
+        the four is returned only if the opponent has no five anywhere, otherwise None
+        :param program_number: Compute as
+        :param recent: how many last moves of each player to be looked
+        :return: same as `choose_next_move`, or None if there is no forced move
+        """
+        opponent = self.opponent(program_number)
+        mine = [move.point for move in self.moves[-recent * 2:] if move.program_number == program_number]
+        theirs = [move.point for move in self.moves[-recent * 2:] if move.program_number == opponent]
+
+        for point in mine:
+            for five in self.five_points(point, program_number):
+                return Move(program_number, five), OptionContainer(Option(OptionType.Win, 1, five))
+
+        for point in theirs:
+            for five in self.five_points(point, opponent):
+                if not self.check_foul(Move(program_number, five)):
+                    return Move(program_number, five), OptionContainer()
+
+        candidates = set()
+        for point in mine:
+            for direction in Direction:
+                dy, dx = direction.value
+                for start in range(-4, 1):
+                    # empties of 5-length window with 3 stones can make four
+                    empties = []
+                    for i in range(start, start + 5):
+                        p = Point(point.y + dy * i, point.x + dx * i)
+                        pn = self.table.get(p)
+                        if pn is None and self.in_table(p):
+                            empties.append(p)
+                        elif pn != program_number:
+                            break
+                    else:
+                        if len(empties) == 2:
+                            candidates.update(empties)
+        for p in candidates:
+            move = Move(program_number, p)
+            if self.check_foul(move):
+                continue
+            self.place(move)
+            # fives made by other stones would have been found above
+            fives = self.five_points(p, program_number)
+            del self.table[p]
+            self.hash ^= zobrist(p, program_number)
+            if len(fives) >= 2:
+                # the opponent may have a five besides the last moves, which wins before this four
+                if any(self.five_points(point, pn) for point, pn in self.table.items() if pn == opponent):
+                    return None
+                return move, OptionContainer(*(Option(OptionType.Checkmate, 1, five) for five in fives))
+        return None
+
+    def check_abort(self):
+        """
+        raise SearchAborted if the search was asked to stop
+        """
+        if self.abort is not None and self.abort.is_set():
+            raise SearchAborted()
+
+    def score_point(self, program_number: int, point: Point) -> OptionContainer:
+        """
+        return all options of `program_number` when it placed at `point`
+        :param program_number: Compute as
+        :param point: point to place
+        :return: OptionContainer sorted by priority
+        """
+        self.check_abort()
+        self.cache.evaluations += 1
+        table = self.copy()
+        table.compute_move(Move(program_number, point))
+        oc = OptionContainer()
+        for line in chain.from_iterable(table.get_lines(program_number).values()):
+            oc = oc.add(table.find_options(line))
+        oc.options.sort(key=lambda v: v.type.priority)
+        return oc
+
+    def rank_points(self, program_number: int, candidates: int = None) -> List[List[Union[OptionContainer, Point]]]:
+        """
+        score candidate points of `program_number` and sort them, the best first.
+        candidates are ranked by `local_score` first, and only the best `candidates` of them and threats are
+        scored by `score_point`. results are stored in `cache` like `choose_next_move`.
+        :param program_number: Compute as
+        :param candidates: how many points to be scored besides threats. defaults to `config.RANK_CANDIDATES`.
+            0 to score all
+        :return: List of [OptionContainer, Point]. don't modify it
+        """
+        if candidates is None:
+            candidates = config.RANK_CANDIDATES
+        key = self.search_key(program_number, None, candidates)  # not a search, but the ranking
+        scores = self.cache.get(key)
+        if scores is None:
+            points = self.available_extended_points(program_number, 2)
+            if candidates and len(points) > candidates:
+                local = [(self.local_score(program_number, point), point) for point in points]
+                local.sort(key=lambda item: -item[0][0])
+                points = [point for i, ((_, threat), point) in enumerate(local) if i < candidates or threat]
+            scores = [[self.score_point(program_number, point), point] for point in points]
+            scores.sort(key=lambda item: (item[0].score, tie_break(item[1], self.seed)), reverse=True)
+            self.cache.put(key, scores)
+        return scores
+
+    def local_score(self, program_number: int, point: Point) -> Tuple[int, bool]:
+        """
+        return cheap score of `point` for `program_number` from the patterns through it, without placing there
+        :param program_number: Compute as
+        :param point: empty point
+        :return: [score, whether it makes a threat]. see `pattern_window`
+        """
+        score = 0
+        threat = False
+        for back, forward, _ in window_rays(point, self.size):
+            s, t = pattern_window(self.window(back, forward, program_number))
+            score += s
+            threat = threat or t
+        return score, threat
+
+    def window(self, back: Tuple[Point, ...], forward: Tuple[Point, ...], program_number: int) -> Tuple[int, ...]:
+        """
+        return cells of a window of `window_rays` for `foul_window` and `pattern_window`, with a stone at the center
+        :param back: cells toward `Line.first`
+        :param forward: cells toward `Line.second`
+        :param program_number: player of the stones of 1
+        :return: tuple of 11 cells
+        """
+        get = self.table.get
+        return ((2,) * (5 - len(back)) +
+                tuple([0 if pn is None else 1 if pn == program_number else 2 for pn in map(get, back)]) +
+                (1,) +
+                tuple([0 if pn is None else 1 if pn == program_number else 2 for pn in map(get, forward)]) +
+                (2,) * (5 - len(forward)))
+
+    def black_foul(self, point: Point) -> bool:
+        """
+        return whether black can't place at empty `point`, by overline, double four or double three.
+        results are kept while the table is unchanged.
+        :param point: empty point
+        :return: bool
+        """
+        if self.fouls_hash != self.hash:
+            self.fouls = {}
+            self.fouls_hash = self.hash
+        foul = self.fouls.get(point)
+        if foul is None:
+            foul = self.fouls[point] = self._black_foul(point)
+        return foul
+
+    def _black_foul(self, point: Point, program_number: int = None) -> bool:
+        """
+        body of `black_foul` without cache. each direction is classified by `foul_window`, and a three is real
+        only if one of the cells to make its straight four isn't foul after placing `point`, checked recursively.
+        :param point: empty point
+        :param program_number: black. defaults to the player of the first move
+        :return: bool
+        """
+        if program_number is None:
+            program_number = self.moves[0].program_number
+        table = self.table
+        get = table.get
+        # fives, fours and threes need another stone within 2 cells, so most directions are skipped
+        near = [(back, forward) for back, forward, cells in window_rays(point, self.size)
+                if program_number in map(get, cells)]
+        if not near:
+            return False
+
+        overline = False
+        fours = 0
+        threes = []
+        for back, forward in near:
+            five, over, four, three = foul_window(self.window(back, forward, program_number))
+            if five:
+                return False
+            overline = overline or over
+            fours += four
+            if three and not four:
+                threes.append([back[offset] if offset < 0 else forward[offset - 1] for offset in three])
+        if overline or fours >= 2:
+            return True
+        if len(threes) < 2:
+            return False
+
+        table[point] = program_number
+        try:
+            real = 0
+            for i, points in enumerate(threes):
+                if any(not self._black_foul(p, program_number) for p in points):
+                    real += 1
+                    if real >= 2:
+                        return True
+                elif real + len(threes) - i - 1 < 2:
+                    return False
+            return False
+        finally:
+            del table[point]
+
+    def find_options_key(self, line: Line) -> tuple:
+        """
+        return key of `find_options_cache` for the line.
+        `find_options` extends the line at most 3 times on each side and checks fouls of those points,
+        so the key has the cells up to the 4th point not of the player on each side, whether black can place
+        on each empty one of them, length of the line and whether the player is black.
+        :param line: line to be computed
+        :return: tuple. hashable key
+        """
+        program_number = line.program_number
+        sides = []
+        for end, forward in ((line.first, False), (line.second, True)):
+            cells = []
+            others = 0
+            for point in ray(end, line.direction, forward, self.size):
+                pn = self.table.get(point)
+                if pn == program_number:
+                    cells.append(1)
+                elif pn is not None:
+                    cells.append(2)  # can't extend beyond
+                    break
+                else:
+                    others += 1
+                    # the 4th one is only checked whether it's placed or not
+                    cells.append(4 if others < 4 and self.black_foul(point) else 0)
+                    if others == 4:
+                        break
+            else:
+                cells.append(3)  # edge of the table
+            sides.append(tuple(cells))
+        return self.is_black(program_number), line.length, sides[0], sides[1]
 
     def find_options(self, line: Line) -> OptionContainer:
         """
-        return preferable option and current condition
+        return preferable option and current condition.
+        results are shared through `find_options_cache` by lines with the same neighbourhood.
         :param line: line to be computed
         :return: OptionContainer
         """
+        key = self.find_options_key(line)
+        cached = find_options_cache.get(key)
+        dy, dx = line.direction.value
+        first = line.first
+        if cached is None:
+            oc = self._find_options(line)
+            # points are kept as the distance from `first`
+            find_options_cache.put(key, tuple(
+                (option.type, option.win_to,
+                 None if option.point is None else option.point.y - first.y if dy else option.point.x - first.x)
+                for option in oc.options))
+            return oc
+        return OptionContainer(*(Option(type_, win_to, None if i is None else Point(first.y + dy * i, first.x + dx * i))
+                                 for type_, win_to, i in cached))
+
+    def _find_options(self, line: Line) -> OptionContainer:
+        """
+        body of `find_options` without cache
+        """
         is_black = self.is_black(line.program_number)
         if line.length > 5 and is_black:
             # for black, more than 5-length line is a total trash
@@ -723,17 +1509,23 @@ class Table:
         :return: int. program number
         """
         numbers = {move.program_number for move in self.moves}
-        numbers.add(self.me)
-        numbers.remove(program_number)
-        return list(numbers)[0]
+        if len(numbers) < 2:
+            # second player haven't placed yet. numbered like `me`
+            numbers.add(self.moves[0].program_number + 1 if self.moves else program_number + 1)
+        numbers.discard(program_number)
+        return min(numbers)
 
     def copy(self) -> 'Table':
         """
         Create copy of `self`.
         :return: Table. copy of itself.
         """
-        new = Table(self.moves[:])
+        new = Table(self.moves[:], self.size)
         new.table = self.table.copy()
+        new.hash = self.hash
+        new.cache = self.cache
+        new.abort = self.abort
+        new.seed = self.seed
         return new
 
     def line_extend_first(self, line: Line, foul_check=True) -> \
@@ -742,20 +1534,15 @@ class Table:
         return line extended in the `first` point direction.
         :return: [extended_Line, extended_point, whether extended successful]
         """
-        line, point, success = line.extend_first()
+        line, point, success = line.extend_first(self.size)
         if not success or (foul_check and self.check_foul(Move(line.program_number, point))):
             return None, None, False
 
         _point = point
-        while True:
-            ny = point.y - line.direction.value[0]
-            nx = point.x - line.direction.value[1]
-            if not (0 <= nx < config.TABLE_SIZE and
-                    0 <= ny < config.TABLE_SIZE and
-                    Point(ny, nx) in self.table and
-                    self.table[Point(ny, nx)] == line.program_number):
+        for next_point in ray(point, line.direction, False, self.size):
+            if self.table.get(next_point) != line.program_number:
                 break
-            point = Point(ny, nx)
+            point = next_point
         line.first = point
 
         return line, _point, success
@@ -766,20 +1553,15 @@ class Table:
         return line extended in the `second` point direction.
         :return: [extended_Line, extended_point, whether extended successful]
         """
-        line, point, success = line.extend_second()
+        line, point, success = line.extend_second(self.size)
         if not success or (foul_check and self.check_foul(Move(line.program_number, point))):
             return None, None, False
 
         _point = point
-        while True:
-            ny = point.y + line.direction.value[0]
-            nx = point.x + line.direction.value[1]
-            if not (0 <= nx < config.TABLE_SIZE and
-                    0 <= ny < config.TABLE_SIZE and
-                    Point(ny, nx) in self.table and
-                    self.table[Point(ny, nx)] == line.program_number):
+        for next_point in ray(point, line.direction, True, self.size):
+            if self.table.get(next_point) != line.program_number:
                 break
-            point = Point(ny, nx)
+            point = next_point
         line.second = point
 
         return line, _point, success
@@ -789,12 +1571,20 @@ class Table:
         pretty print the table. '―｜■○'
         """
         black = self.moves and self.moves[0].program_number
-        nums = list('①②③④⑤⑥⑦⑧⑨⑩⑪⑫⑬⑭⑮')
-
-        lines = ['　　' + '　'.join(nums)]
-        for y in range(config.TABLE_SIZE):
-            line = [nums[y], '　']
-            for x in range(config.TABLE_SIZE):
+        if self.size:
+            ys = xs = range(self.size)
+        else:
+            # unbounded. print around the placed stones
+            points = list(self.table) or [self.center]
+            ys = range(min(p.y for p in points) - 2, max(p.y for p in points) + 3)
+            xs = range(min(p.x for p in points) - 2, max(p.x for p in points) + 3)
+        # labeled as in the data file
+        offset = config.TABLE_STARTS_WITH_ONE
+
+        lines = ['　　' + '　'.join(label(x + offset) for x in xs)]
+        for y in ys:
+            line = [label(y + offset), '　']
+            for x in xs:
                 if Point(y, x) in self.table:
                     if self.table[Point(y, x)] == black:
                         line.append('■')
@@ -805,10 +1595,56 @@ class Table:
                 line.append('―')
             line.pop()
             lines.append(''.join(line))
-            lines.append('　　' + ('｜　' * config.TABLE_SIZE)[:-1])
+            lines.append('　　' + ('｜　' * len(xs))[:-1])
         lines.pop()
         print('\n'.join(lines))
 
+    @property
+    def center(self) -> Point:
+        """
+        return center of the table
+        :return: Point
+        """
+        return Point(self.size // 2, self.size // 2)
+
+    def in_table(self, point: Point) -> bool:
+        """
+        return whether point is inside of the table
+        :param point: point to check
+        :return: bool
+        """
+        return in_table(point, self.size)
+
+    @classmethod
+    def from_board(cls, board: str, size: int = None) -> 'Table':
+        """
+        Create computed table from compact board. Moves are made up by alternating black and white stones,
+        so `me` and `is_black` work as usual.
+        :param board: cells in row-major order. '0' or '.' for empty, '1' for black, '2' for white.
+            whitespaces are ignored
+        :param size: size of the table. defaults to `config.TABLE_SIZE`
+        :return: Table
+        """
+        size = config.TABLE_SIZE if size is None else size
+        cells = ''.join(board.split())
+        if not size or len(cells) != size * size:
+            raise ValueError('board must have {} cells, but has {}'.format(size * size, len(cells)))
+        stones = {'1': [], '2': []}
+        for i, cell in enumerate(cells):
+            if cell in stones:
+                stones[cell].append(Point(i // size, i % size))
+            elif cell not in '0.':
+                raise ValueError('unknown cell: {!r}'.format(cell))
+        black, white = stones['1'], stones['2']
+        if not len(white) <= len(black) <= len(white) + 1:
+            raise ValueError('count of stones is incorrect. (black: {}, white: {})'.format(len(black), len(white)))
+
+        moves = [Move(1 + i % 2, (black, white)[i % 2][i // 2]) for i in range(len(black) + len(white))]
+        table = cls(moves, size)
+        for move in moves:
+            table.place(move)
+        return table
+
     def is_black(self, program_number: int) -> bool:
         """
         return whether player of program_number is black
@@ -818,22 +1654,102 @@ class Table:
         return not self.moves_count or program_number == self.moves[0].program_number
 
 
+class Ponderer:
+    def __init__(self, table: Table, program_number: int, depth=1, best=5, replies=3):
+        """
+        Search on the opponent's time. While the opponent is thinking, predicted replies are played on a copy
+        of `table` and `choose_next_move` of `program_number` is computed for each of them. Results go to
+        `table.cache`, so the next `choose_next_move` after the actual reply starts from them.
+        :param table: table where the opponent is to move
+        :param program_number: player to ponder for
+        :param depth: depth of `choose_next_move` to be computed
+        :param best: best of `choose_next_move` to be computed
+        :param replies: how many replies of the opponent to be predicted
+        """
+        self.table = table.copy()
+        self.table.abort = threading.Event()
+        self.program_number = program_number
+        self.depth = depth
+        self.best = best
+        self.replies = replies
+        self.pondered: List[Move] = []
+        self.thread: Union[threading.Thread, None] = None
+
+    def predict(self) -> List[Move]:
+        """
+        return replies of the opponent, most likely first
+        :return: List[Move]
+        """
+        opponent = self.table.opponent(self.program_number)
+        predicted = [self.table.choose_next_move(opponent, 1, self.best)[0]]
+        for _, point in self.table.rank_points(opponent):
+            if len(predicted) >= self.replies:
+                break
+            move = Move(opponent, point)
+            if move not in predicted:
+                predicted.append(move)
+        return predicted
+
+    def run(self):
+        """
+        ponder until all predicted replies are searched or `stop` is called
+        """
+        try:
+            for reply in self.predict():
+                table = self.table.copy()
+                if table.compute_move(reply) or table.is_win(reply.program_number, reply.point):
+                    continue
+                table.choose_next_move(self.program_number, self.depth, self.best)
+                self.pondered.append(reply)
+        except SearchAborted:
+            pass
+
+    def start(self) -> 'Ponderer':
+        """
+        start pondering in background
+        :return: self
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        stop pondering. searches finished so far stay in the cache.
+        """
+        self.table.abort.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
 def load_data(filename: str) -> Tuple[int, List[Move]]:
     """
-    Load data with given filename
+    Load data with given filename. moves appended to the journal of the file by `Journal` are included.
     :param filename: filename of moves
     :return: Tuple[total_moves, List[Move]]
     """
-    data = []
-    count = 0
+    data = ''
     if os.path.exists(filename):
         with open(filename, 'r') as f:
             data = f.read()
-        if data:
-            count, *data = [list(map(int, d.split(';'))) for d in data.split(',')]
-            count = count[0]
-    moves = [Move(program_number, Point(y - config.TABLE_STARTS_WITH_ONE, x - config.TABLE_STARTS_WITH_ONE)) for
-             program_number, y, x in data]
+    count, moves = parse_data(data)
+    journaled = Journal(filename).read(moves)[1]
+    return count + len(journaled), moves + journaled
+
+
+def parse_data(data: str) -> Tuple[int, List[Move]]:
+    """
+    Parse moves in the format of data file, `count,pn;y;x,pn;y;x,...`
+    :param data: moves
+    :return: Tuple[total_moves, List[Move]]
+    """
+    count = 0
+    moves = []
+    if data.strip():
+        count, *records = [list(map(int, d.split(';'))) for d in data.strip().split(',') if d]
+        count = count[0]
+        moves = [Move(program_number, Point(y - config.TABLE_STARTS_WITH_ONE, x - config.TABLE_STARTS_WITH_ONE))
+                 for program_number, y, x in records]
 
     if count != len(moves):
         if config.RAISE_ON_CSV_COUNT_ERROR:
@@ -843,29 +1759,320 @@ def load_data(filename: str) -> Tuple[int, List[Move]]:
     return count, moves
 
 
+def moves_digest(moves: List[Move]) -> str:
+    """
+    return digest of moves, to check whether a game is continued from them
+    :param moves: moves to digest
+    :return: str. hex digest
+    """
+    return hashlib.sha1(','.join('{};{};{}'.format(move.program_number, move.point.y, move.point.x)
+                                 for move in moves).encode()).hexdigest()
+
+
+def save_state(filename: str, table: Table):
+    """
+    Write how many moves of the table are validated next to the data file, so the next run doesn't need to validate
+    them again. The state is plain JSON, so loading it can't run anything. Searched results aren't saved.
+    :param filename: filename of moves. the state is written to `filename + config.STATE_SUFFIX`
+    :param table: computed table to save
+    """
+    state = {
+        'version': 3,
+        'size': table.size,
+        'moves_count': table.moves_count,
+        'digest': moves_digest(table.moves),
+    }
+    tmp = filename + config.STATE_SUFFIX + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, filename + config.STATE_SUFFIX)
+
+
+def load_state(filename: str, moves: List[Move], size: int = None) -> Tuple[Table, int]:
+    """
+    Create table of `moves` from the state written by `save_state`.
+    The validated moves are placed from `moves` without checking fouls again, so the board can't differ from them.
+    If the state is missing, broken or doesn't match the beginning of `moves`, the table is empty.
+    :param filename: filename of moves
+    :param moves: All moves
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :return: Tuple[Table, count of moves already validated]. pass the count to `Table.compute`
+    """
+    table = Table(moves, size)
+    try:
+        with open(filename + config.STATE_SUFFIX) as f:
+            state = json.load(f)
+        if state['version'] != 3 or state['size'] != table.size or type(state['moves_count']) is not int or \
+                not 0 <= state['moves_count'] <= len(moves) or \
+                state['digest'] != moves_digest(moves[:state['moves_count']]):
+            return table, 0
+    except (OSError, KeyError, TypeError, ValueError):
+        return table, 0
+    for move in moves[:state['moves_count']]:
+        if move.point in table.table or not table.in_table(move.point):
+            return Table(moves, size), 0
+        table.place(move)
+    return table, state['moves_count']
+
+
 def write_data(filename: str, table: Table):
     """
     Write moves with given filename
     :param filename: filename to write
     :param table: table to write
     """
-    with open(filename, 'w') as f:
-        f.write('{},{}'.format(str(table.moves_count), ','.join(
-            [';'.join(map(str, [move.program_number, move.point.y + config.TABLE_STARTS_WITH_ONE,
-                                move.point.x + config.TABLE_STARTS_WITH_ONE])) for move in table.moves])))
+    # replace at once, so a crash while writing doesn't lose the previous data
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(format_data(table.moves))
+    os.replace(tmp, filename)
+
+
+def format_data(moves: List[Move]) -> str:
+    """
+    Format moves in the format of data file, `count,pn;y;x,pn;y;x,...`
+    :param moves: moves to format
+    :return: str
+    """
+    return '{},{}'.format(str(len(moves)), ','.join([format_move(move) for move in moves]))
+
+
+def format_move(move: Move) -> str:
+    """
+    Format single move in the format of data file, `pn;y;x`
+    :param move: move to format
+    :return: str
+    """
+    return ';'.join(map(str, [move.program_number, move.point.y + config.TABLE_STARTS_WITH_ONE,
+                              move.point.x + config.TABLE_STARTS_WITH_ONE]))
+
+
+class Journal:
+    def __init__(self, filename: str, compact_size: int = None):
+        """
+        Append-only log of moves next to the data file, so saving a move doesn't rewrite the whole file.
+        The header has the count and digest of moves in the data file it follows, and each record has the index
+        of the move and CRC32 of itself. A record torn by a crash fails its check, and it and the rest are ignored.
+        Records are merged into the data file when there are `compact_size` of them.
+        Writers hold a lock of `path + '.lock'` from reading the journal until writing it, so two of them can't
+        record the same index.
+        :param filename: filename of moves. the journal is `filename + config.JOURNAL_SUFFIX`
+        :param compact_size: how many records to keep before compaction. defaults to `config.JOURNAL_COMPACT_SIZE`
+        """
+        self.filename = filename
+        self.path = filename + config.JOURNAL_SUFFIX
+        self.compact_size = config.JOURNAL_COMPACT_SIZE if compact_size is None else compact_size
+        self.moves: List[Move] = []  # all moves of the data file and the journal
+        self.base = 0  # moves in the data file, which records follow
+        self.size = 0  # bytes of the valid part of the journal. 0 if there is no valid header
+        self.header = b''  # the first line of the journal when it was read or written
+        self.loaded = False
+
+    @staticmethod
+    def record(index: int, move: Move) -> str:
+        """
+        return a line of the journal
+        :param index: index of the move in the game
+        :param move: move to record
+        :return: str. ends with newline
+        """
+        body = '{},{}'.format(index, format_move(move))
+        return '{},{:08x}\n'.format(body, zlib.crc32(body.encode()))
+
+    def read(self, moves: List[Move]) -> Tuple[int, List[Move]]:
+        """
+        return moves recorded after `moves`, which are read from the data file
+        :param moves: moves in the data file
+        :return: Tuple[bytes of the valid part of the journal, List[Move]]. 0 and [] if the journal doesn't follow
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                lines = f.read().split(b'\n')
+        except OSError:
+            return 0, []
+        try:
+            tag, version, base, digest = lines[0].decode().split(' ')
+            base = int(base)
+        except (UnicodeDecodeError, ValueError):
+            return 0, []
+        if tag != 'journal' or version != '1' or base > len(moves) or digest != moves_digest(moves[:base]):
+            return 0, []
+
+        size = len(lines[0]) + 1
+        recorded = []
+        # the last one is empty, or torn if it has no newline
+        for line in lines[1:-1]:
+            try:
+                index, record, crc = line.decode().split(',')
+                program_number, y, x = map(int, record.split(';'))
+                index, crc = int(index), int(crc, 16)
+            except (UnicodeDecodeError, ValueError):
+                break
+            if index != base + len(recorded) or crc != zlib.crc32('{},{}'.format(index, record).encode()):
+                break
+            recorded.append(Move(program_number, Point(y - config.TABLE_STARTS_WITH_ONE,
+                                                       x - config.TABLE_STARTS_WITH_ONE)))
+            size += len(line) + 1
+        # records before `len(moves)` are already merged into the data file
+        if len(moves) > base + len(recorded) or recorded[:len(moves) - base] != moves[base:]:
+            return 0, []
+        return size, recorded[len(moves) - base:]
+
+    def load(self) -> List[Move]:
+        """
+        read the data file and the journal
+        :return: List[Move]. all moves
+        """
+        data = ''
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r') as f:
+                data = f.read()
+        moves = parse_data(data)[1]
+        self.size, recorded = self.read(moves)
+        self.header = self.head()
+        self.base = len(moves)
+        self.moves = moves + recorded
+        self.loaded = True
+        return self.moves[:]
+
+    def head(self) -> bytes:
+        """
+        return the first line of the journal. b'' if it doesn't exist
+        :return: bytes
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                return f.readline()
+        except OSError:
+            return b''
+
+    def changed(self) -> bool:
+        """
+        return whether the journal was written by another writer or torn since it was read.
+        another one may have compacted it into the same size, so the header is compared too
+        :return: bool
+        """
+        return not self.loaded or self.file_size() != self.size or self.head() != self.header
+
+    def file_size(self) -> int:
+        """
+        return bytes of the journal. 0 if it doesn't exist
+        :return: int
+        """
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    @contextmanager
+    def lock(self):
+        """
+        hold the lock of the journal against other writers. the journal itself can't be locked, as compaction
+        replaces it
+        """
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def append(self, move: Move):
+        """
+        add a move to the journal. the move is written by a single append, so it doesn't mix with other writers
+        :param move: move to add
+        """
+        with self.lock():
+            if self.changed():
+                # written by another one, or torn
+                self.load()
+            if not self.size:
+                self._compact()
+            elif self.file_size() != self.size:
+                # drop a torn record
+                os.truncate(self.path, self.size)
+            line = self.record(len(self.moves), move).encode()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+            self.moves.append(move)
+            self.size += len(line)
+            if len(self.moves) - self.base >= self.compact_size:
+                self._compact()
+
+    def compact(self):
+        """
+        write all moves into the data file and start an empty journal. both files are replaced at once.
+        """
+        with self.lock():
+            if self.changed():
+                self.load()
+            self._compact()
+
+    def _compact(self):
+        """
+        body of `compact` without the lock
+        """
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(format_data(self.moves))
+        os.replace(tmp, self.filename)
+
+        header = 'journal 1 {} {}\n'.format(len(self.moves), moves_digest(self.moves))
+        with open(self.path + '.tmp', 'w') as f:
+            f.write(header)
+        os.replace(self.path + '.tmp', self.path)
+        self.base = len(self.moves)
+        self.header = header.encode()
+        self.size = len(self.header)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        filename = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Renju player')
+    parser.add_argument('filename', nargs='?', help='file of moves. defaults to `data.txt`')
+    parser.add_argument('--self-play', action='store_true', help='play against itself until the game ends')
+    parser.add_argument('--size', type=int, help='size of the table. 0 for the unbounded table. '
+                                                 'defaults to `config.TABLE_SIZE`')
+    parser.add_argument('--search', choices=('minimax', 'mcts'), default='minimax',
+                        help='`choose_next_move` or Monte Carlo tree search. defaults to minimax')
+    parser.add_argument('--simulations', type=int, default=1000, help='rollouts per move of mcts')
+    parser.add_argument('--time', type=float, help='seconds per move of mcts')
+    parser.add_argument('--processes', type=int, help='rollout processes of mcts. defaults to the number of CPUs')
+    parser.add_argument('--journal', action='store_true',
+                        help='append each move to the journal of the file instead of rewriting the file')
+    parser.add_argument('--profile', metavar='PREFIX',
+                        help='search the loaded position under the profiler, write PREFIX.txt, PREFIX.folded and '
+                             'PREFIX.prof, and exit without playing')
+    args = parser.parse_args()
+    if args.size is not None and args.size != 0 and not 5 <= args.size <= config.MAX_TABLE_SIZE:
+        parser.error('--size must be 0 or from 5 to {}: {}'.format(config.MAX_TABLE_SIZE, args.size))
+
+    mcts = None
+    if args.search == 'mcts':
+        # let `mcts` share the classes of this script instead of importing another `main`
+        sys.modules.setdefault('main', sys.modules['__main__'])
+        from mcts import MCTS
+        mcts = MCTS(args.simulations, args.time, args.processes)
+
+    if args.filename:
+        filename = args.filename
     else:
         warnings.warn('no filename given. defaults to `data.txt`')
         filename = 'data.txt'
 
-    count, data = load_data(filename)
+    total, data = load_data(filename)
+    journal = Journal(filename) if args.journal else None
 
-    table = Table(data)
-    move, is_win = table.compute()
+    table, validated = load_state(filename, data, args.size)
+    move, is_win = table.compute(validated)
+    if move is None and table.moves and table.is_win(table.moves[-1].program_number, table.moves[-1].point):
+        # the game was already won when the state was saved
+        move, is_win = table.moves[-1], True
     print('current table:\n')
     table.pretty_print()
     if move:
@@ -876,30 +2083,45 @@ if __name__ == '__main__':
             raise ValueError("Player number {} can't place here, {}".format(move.program_number, move.point))
 
     print('\n' * 2)
-    move, op = table.choose_next_move(table.me, depth=3, best=3)
-    print('chose move:', move)
-    foul = table.compute_move(move)
-    if foul:
-        print('foul', move)
-    table.pretty_print()
-    if table.is_win(move.program_number):
-        print('win', move)
-
-    # ##### Code to play against itself
-    # while True:
-    #     me = table.me
-    #     if me == 1:
-    #         move, op = table.choose_next_move(table.me, depth=3, best=3)
-    #     else:
-    #         move, op = table.choose_next_move(table.me, depth=2, best=3)
-    #     foul = table.compute_move(move)
-    #     print(me, move)
-    #     if foul:
-    #         print('foul', move)
-    #     table.pretty_print()
-    #     if table.is_win(move.program_number):
-    #         print('win', move)
-    #         break
-    #     print('\n' * 5)
-
-    write_data(filename, table)
+    if args.profile:
+        from profiling import Profiler
+        with Profiler(args.profile) as profiler:
+            with profiler.search('move {}'.format(table.moves_count + 1)):
+                move = mcts.search(table) if mcts else table.choose_next_move(table.me, depth=3, best=3)[0]
+        if mcts:
+            mcts.close()
+        print('chose move:', move)
+        print(profiler.report())
+        print('profile written to', ', '.join(args.profile + ext for ext in ('.txt', '.folded', '.prof')))
+        exit()
+
+    while True:
+        # both players share `table.cache`, so a reply searched in the opponent's turn is reused
+        me = table.me
+        if mcts:
+            # the tree is kept between moves of both players
+            move = mcts.search(table)
+        elif me == 1 or not args.self_play:
+            move, op = table.choose_next_move(me, depth=3, best=3)
+        else:
+            move, op = table.choose_next_move(me, depth=2, best=3)
+        print('chose move:', move)
+        foul = table.compute_move(move)
+        if foul:
+            print('foul', move)
+        elif journal:
+            journal.append(move)
+        table.pretty_print()
+        table.cache.prune(table.moves_count)
+        if table.is_win(move.program_number, move.point):
+            print('win', move)
+            break
+        if not args.self_play or foul:
+            break
+        print('\n' * 5)
+
+    if mcts:
+        mcts.close()
+    if not journal:
+        write_data(filename, table)
+    save_state(filename, table)
@@ -0,0 +1,307 @@
+import math
+import random
+import time
+from multiprocessing import Pool
+from typing import Dict, List, Tuple, Union
+
+from main import *
+
+
+class Node:
+    def __init__(self, move: Union[Move, None], parent: Union['Node', None], prior: float):
+        """
+        Node of the search tree. `wins` are counted for the player of `move`.
+        :param move: move which led to this node. None for the root of the empty tree
+        :param parent: parent node. None for the root
+        :param prior: probability of `move` given by `find_options`
+        """
+        self.move = move
+        self.parent = parent
+        self.prior = prior
+        self.children: Dict[Point, 'Node'] = {}
+        self.visits = 0
+        self.wins = 0.0
+        self.expanded = False
+        self.winner: Union[int, None] = None  # program_number who won by `move`, 0 for draw. None if not ended
+
+    def select(self, exploration: float) -> 'Node':
+        """
+        return the child with the highest UCT value, with the prior as the exploration weight
+        :param exploration: weight of exploration
+        :return: Node
+        """
+        sqrt_visits = math.sqrt(self.visits)
+
+        def uct(child: 'Node') -> float:
+            value = child.wins / child.visits if child.visits else 0.5
+            return value + exploration * child.prior * sqrt_visits / (1 + child.visits)
+
+        return max(self.children.values(), key=uct)
+
+
+def point_score(table: Table, program_number: int, point: Point) -> int:
+    """
+    return score of the lines through `point` when `program_number` placed there. lighter than `score_point`,
+    which scores all lines of the table
+    :param table: table where `point` is empty
+    :param program_number: Compute as
+    :param point: point to place
+    :return: int. `OptionContainer.score` of the options of the lines
+    """
+    move = Move(program_number, point)
+    table.place(move)
+    oc = OptionContainer()
+    for direction in Direction:
+        dy, dx = direction.value
+        first = second = point
+        while table.table.get(Point(first.y - dy, first.x - dx)) == program_number:
+            first = Point(first.y - dy, first.x - dx)
+        while table.table.get(Point(second.y + dy, second.x + dx)) == program_number:
+            second = Point(second.y + dy, second.x + dx)
+        if first == second:
+            # single stone has no options
+            continue
+        oc = oc.add(table.find_options(Line(direction, first, second, program_number)))
+    del table.table[point]
+    table.hash ^= zobrist(point, program_number)
+    return oc.score
+
+
+def rollout(table: Table, program_number: int, rng: random.Random, limit: int) -> int:
+    """
+    play random moves from the table until someone makes five, and return the winner.
+    a player always makes five or blocks five of the opponent if it can, and black never plays a foul move.
+    :param table: table to play on. it is modified
+    :param program_number: player to move
+    :param rng: random generator
+    :param limit: maximum number of moves to play
+    :return: int. program_number of the winner, 0 for draw
+    """
+    candidates = set()
+
+    def add_neighbours(point: Point):
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                p = Point(point.y + dy, point.x + dx)
+                if p not in table.table and table.in_table(p):
+                    candidates.add(p)
+
+    for point in list(table.table):
+        if table.table[point] is not None:
+            add_neighbours(point)
+
+    opponent = table.opponent(program_number)
+    last = {move.program_number: move.point for move in table.moves}
+    for _ in range(limit):
+        is_black = table.is_black(program_number)
+        # make five, then block five
+        forced = [p for pn in (program_number, opponent) if pn in last for p in table.five_points(last[pn], pn)]
+        point = None
+        for p in forced:
+            if not (is_black and table.black_foul(p)):
+                point = p
+                break
+        while point is None and candidates:
+            p = rng.choice(tuple(candidates))
+            if is_black and table.black_foul(p):
+                candidates.discard(p)
+                continue
+            point = p
+        if point is None:
+            return 0
+
+        table.place(Move(program_number, point))
+        if table.makes_five(Move(program_number, point)):
+            return program_number
+        candidates.discard(point)
+        add_neighbours(point)
+        last[program_number] = point
+        program_number, opponent = opponent, program_number
+    return 0
+
+
+def _rollout(args: tuple) -> int:
+    moves, size, program_number, seed, limit = args
+    table = Table(moves, size)
+    for move in moves:
+        table.place(move)
+    return rollout(table, program_number, random.Random(seed), limit)
+
+
+class MCTS:
+    def __init__(self, simulations: int = 1000, time_limit: float = None, processes: int = None, batch: int = 16,
+                 width: int = 8, exploration: float = 1.5, limit: int = 60, seed: int = None):
+        """
+        Monte Carlo tree search. Nodes are selected by UCT weighted by priors from `find_options` scores,
+        and evaluated by random rollouts which are run in batches on a process pool.
+        The tree is kept between moves, so the subtree of the actual move is reused.
+        :param simulations: how many rollouts per move
+        :param time_limit: seconds per move. if given, it stops when either of budgets runs out
+        :param processes: number of worker processes. defaults to the number of CPUs. 0 to roll out in this process
+        :param batch: how many leaves are selected before rolling them out at once
+        :param width: how many candidates to be expanded for each node
+        :param exploration: weight of exploration in UCT
+        :param limit: maximum number of moves of a rollout. longer one is a draw
+        :param seed: seed of rollouts
+        """
+        self.simulations = simulations
+        self.time_limit = time_limit
+        self.processes = processes
+        self.batch = batch
+        self.width = width
+        self.exploration = exploration
+        self.limit = limit
+        self.rng = random.Random(seed)
+        self.pool: Union[Pool, None] = None
+        self.root: Union[Node, None] = None
+        self.root_moves: List[Move] = []
+        self.rollouts = 0  # rollouts of the last search
+
+    def close(self):
+        """
+        terminate the process pool
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def __enter__(self) -> 'MCTS':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def reuse(self, table: Table) -> Node:
+        """
+        set the root to the node of `table`, reusing the subtree if `table` follows the previous root
+        :param table: current table
+        :return: Node. new root
+        """
+        moves = table.moves
+        node = self.root
+        if node is not None and moves[:len(self.root_moves)] == self.root_moves:
+            for move in moves[len(self.root_moves):]:
+                node = node.children.get(move.point)
+                if node is None or node.move != move:
+                    node = None
+                    break
+        else:
+            node = None
+        if node is None:
+            node = Node(moves[-1] if moves else None, None, 1.0)
+        node.parent = None
+        self.root = node
+        self.root_moves = moves[:]
+        return node
+
+    def expand(self, node: Node, table: Table):
+        """
+        add children of the best `width` points of either player, with priors by their scores
+        :param node: leaf node of `table`
+        :param table: table of the node
+        """
+        node.expanded = True
+        program_number = table.me
+        forced = table.find_forced_move(program_number)
+        if forced:
+            points = [(forced[0].point, 1.0)]
+        else:
+            opponent = table.opponent(program_number)
+            candidates = set(table.available_extended_points(program_number, 2))
+            candidates.update(table.available_extended_points(opponent, 2))
+            scores = [(max(point_score(table, program_number, point), point_score(table, opponent, point)), point)
+                      for point in candidates if not table.check_foul(Move(program_number, point))]
+            scores.sort(key=lambda item: -item[0])
+            points = [(point, math.log1p(score) + 1) for score, point in scores[:self.width]]
+        total = sum(weight for _, weight in points)
+        for point, weight in points:
+            move = Move(program_number, point)
+            child = node.children[point] = Node(move, node, weight / total)
+            table.place(move)
+            if table.makes_five(move):
+                child.winner = program_number
+                child.expanded = True
+            del table.table[point]
+            table.hash ^= zobrist(point, program_number)
+        if not points:
+            node.winner = 0
+
+    def search(self, table: Table) -> Move:
+        """
+        search and return the move of the player to move
+        :param table: computed table
+        :return: Move
+        """
+        program_number = table.me
+        if table.moves_count < 3:
+            return table.choose_next_move(program_number, 1)[0]
+
+        root = self.reuse(table)
+        if not root.expanded:
+            self.expand(root, table.copy())
+        for child in root.children.values():
+            if child.winner == program_number or len(root.children) == 1:
+                return child.move
+
+        self.rollouts = 0
+        end = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        while self.rollouts < self.simulations and (end is None or time.perf_counter() < end):
+            leaves: List[Tuple[Node, Union[tuple, None]]] = []
+            for _ in range(min(self.batch, self.simulations - self.rollouts)):
+                leaves.append(self.select(root, table))
+            tasks = [task for _, task in leaves if task is not None]
+            results = iter(self.map(tasks))
+            for node, task in leaves:
+                self.backpropagate(node, node.winner if task is None else next(results))
+            self.rollouts += len(leaves)
+
+        best = max(root.children.values(), key=lambda child: child.visits)
+        return best.move
+
+    def select(self, root: Node, table: Table) -> Tuple[Node, Union[tuple, None]]:
+        """
+        walk down to a leaf and expand it. visits are counted on the way, so that leaves of the same batch differ.
+        :param root: root node
+        :param table: table of the root
+        :return: [leaf, task for `_rollout`]. task is None if the game ended at the leaf
+        """
+        node = root
+        node.visits += 1
+        table = table.copy()
+        while node.expanded and node.children:
+            node = node.select(self.exploration)
+            node.visits += 1
+            table.compute_move(node.move)
+        if node.winner is not None:
+            return node, None
+        self.expand(node, table)
+        if node.winner is not None:
+            return node, None
+        return node, (table.moves, table.size, table.me, self.rng.getrandbits(32), self.limit)
+
+    def map(self, tasks: List[tuple]) -> List[int]:
+        """
+        run rollouts on the pool
+        :param tasks: arguments of `_rollout`
+        :return: List[int]. winners
+        """
+        if self.processes == 0 or not tasks:
+            return list(map(_rollout, tasks))
+        if self.pool is None:
+            self.pool = Pool(self.processes)
+        return self.pool.map(_rollout, tasks)
+
+    @staticmethod
+    def backpropagate(node: Node, winner: int):
+        """
+        add the result to nodes from the leaf to the root. visits are already counted by `select`
+        :param node: leaf node
+        :param winner: program_number of the winner, 0 for draw
+        """
+        while node is not None:
+            if node.move is not None:
+                if winner == node.move.program_number:
+                    node.wins += 1
+                elif not winner:
+                    node.wins += 0.5
+            node = node.parent
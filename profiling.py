@@ -0,0 +1,148 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple, Union
+
+
+class Profiler:
+    def __init__(self, prefix: str = None, interval: float = 0.001, memory: bool = True, limit: int = 30):
+        """
+        Profile the code run while started, e.g. in `with Profiler('out'):`. functions are measured by cProfile,
+        stacks of the thread are sampled from another thread every `interval` seconds, and allocations are traced
+        by tracemalloc. Each `search` block is reported with its time and peak memory.
+        :param prefix: if given, results are saved to files starting with it when `with` ends
+        :param interval: seconds between samples of stacks
+        :param memory: whether to trace allocations. it makes the code a few times slower
+        :param limit: how many functions and allocations to report
+        """
+        self.prefix = prefix
+        self.interval = interval
+        self.memory = memory
+        self.limit = limit
+        self.profile = cProfile.Profile()
+        self.stacks: Counter = Counter()  # `caller;callee` to samples
+        self.searches: List[Tuple[str, float, Union[int, None]]] = []  # [label, seconds, peak bytes]
+        self.snapshots: List[tracemalloc.Snapshot] = []  # at start and stop
+        self._stop = threading.Event()
+        self._sampler: Union[threading.Thread, None] = None
+        self._tracing = False
+
+    def start(self):
+        """
+        start profiling the current thread
+        """
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if self.memory:
+            self.snapshots = [self._snapshot()]
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, args=(threading.get_ident(),), daemon=True)
+        self._sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        """
+        stop profiling
+        """
+        self.profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        if self.memory and tracemalloc.is_tracing():
+            self.snapshots.append(self._snapshot())
+            if self._tracing:
+                tracemalloc.stop()
+                self._tracing = False
+
+    def __enter__(self) -> 'Profiler':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        if self.prefix:
+            self.save(self.prefix)
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        # samples of stacks are allocated by the profiler itself
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, __file__),))
+
+    def _sample(self, ident: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename),
+                                                 code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    @contextmanager
+    def search(self, label: str) -> Iterator[None]:
+        """
+        measure time and peak memory of a block, e.g. a `choose_next_move`
+        :param label: name of the block in the report
+        """
+        peak = None
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.memory and tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1] - base
+            self.searches.append((label, elapsed, peak))
+
+    def collapsed(self) -> List[str]:
+        """
+        return sampled stacks in the collapsed format of flamegraph tools, `caller;callee samples`
+        :return: List[str]
+        """
+        return ['{} {}'.format(stack, samples) for stack, samples in sorted(self.stacks.items())]
+
+    def report(self) -> str:
+        """
+        return the report of searches, hot spots by cProfile and memory kept since start by tracemalloc
+        :return: str
+        """
+        out = io.StringIO()
+        if self.searches:
+            out.write('{:<24}{:>12}{:>14}\n'.format('search', 'seconds', 'peak KiB'))
+            for label, elapsed, peak in self.searches:
+                out.write('{:<24}{:>12.3f}{:>14}\n'.format(
+                    label, elapsed, '-' if peak is None else '{:.1f}'.format(peak / 1024)))
+            out.write('\n')
+        out.write('hot spots\n')
+        pstats.Stats(self.profile, stream=out).sort_stats('tottime').print_stats(self.limit)
+        if len(self.snapshots) == 2:
+            out.write('allocations kept\n')
+            for stat in self.snapshots[1].compare_to(self.snapshots[0], 'lineno')[:self.limit]:
+                out.write('{}\n'.format(stat))
+        return out.getvalue()
+
+    def save(self, prefix: str) -> List[str]:
+        """
+        write `prefix.txt` of `report`, `prefix.folded` of `collapsed` and `prefix.prof` of pstats
+        :param prefix: path without extension
+        :return: List[str]. written files
+        """
+        files = [prefix + '.txt', prefix + '.folded', prefix + '.prof']
+        with open(files[0], 'w') as f:
+            f.write(self.report())
+        with open(files[1], 'w') as f:
+            f.writelines(line + '\n' for line in self.collapsed())
+        self.profile.dump_stats(files[2])
+        return files
@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import random
+from dataclasses import dataclass, field
+from multiprocessing import Pool
+from typing import Iterator, List, Set
+
+from main import *
+
+try:
+    import numpy as np
+except ImportError:  # only writing and reading shards need numpy
+    np = None
+
+MANIFEST = 'manifest.json'
+
+
+@dataclass
+class GameRecord:
+    """
+    Positions of single self-play game
+    :param index: index of the game, which also decides its random opening
+    :param size: size of the table
+    :param boards: cells before each move, `size * size` bytes of 0 for empty, 1 for the player to move
+        and 2 for the opponent
+    :param players: program_number to move of each position. 1 is black
+    :param moves: chosen move of each position, `y * size + x`
+    :param scores: score of `choose_next_move` of each position
+    :param winner: program_number of the winner, 0 for draw
+    """
+    index: int
+    size: int
+    boards: List[bytes] = field(default_factory=list)
+    players: List[int] = field(default_factory=list)
+    moves: List[int] = field(default_factory=list)
+    scores: List[int] = field(default_factory=list)
+    winner: int = 0
+
+
+def board_bytes(table: Table, program_number: int) -> bytes:
+    """
+    return cells of the table from the view of `program_number`. see `GameRecord.boards`
+    :param table: table of the position
+    :param program_number: player to move
+    :return: bytes
+    """
+    size = table.size
+    cells = bytearray(size * size)
+    for point, pn in table.table.items():
+        cells[point.y * size + point.x] = 1 if pn == program_number else 2
+    return bytes(cells)
+
+
+def play_game(index: int, depth: int = 2, best: int = 3, size: int = None, opening: int = 4,
+              max_moves: int = None, seed: int = 0) -> GameRecord:
+    """
+    play a game against itself with `choose_next_move`. the first `opening` moves are random points
+    near the stones, so that games differ from each other
+    :param index: index of the game
+    :param depth: depth of `choose_next_move`
+    :param best: best of `choose_next_move`
+    :param size: size of the table. defaults to `config.TABLE_SIZE`. the unbounded table can't be written as planes
+    :param opening: how many random moves to start with
+    :param max_moves: the game is a draw after this many moves. defaults to all cells
+    :param seed: seed of all games. each game is seeded by `seed` and `index`
+    :return: GameRecord
+    """
+    table = Table([], size or config.TABLE_SIZE)
+    if not table.size:
+        raise ValueError('the unbounded table is not supported')
+    rng = random.Random('{}:{}'.format(seed, index))
+    record = GameRecord(index, table.size)
+    max_moves = max_moves or table.size * table.size
+
+    while table.moves_count < max_moves:
+        program_number = table.me
+        if table.moves_count < opening:
+            center = table.center
+            stones = [move.point for move in table.moves] or [center]
+            around = [Point(p.y + dy, p.x + dx) for p in stones for dy in range(-2, 3) for dx in range(-2, 3)]
+            points = sorted(set(p for p in around if table.in_table(p) and p not in table.table),
+                            key=lambda p: (p.y, p.x))
+            move, score = Move(program_number, rng.choice(points)), 0
+        else:
+            move, oc = table.choose_next_move(program_number, depth, best)
+            score = oc.score
+        record.boards.append(board_bytes(table, program_number))
+        record.players.append(program_number)
+        record.moves.append(move.point.y * table.size + move.point.x)
+        record.scores.append(score)
+        if table.compute_move(move):
+            # foul loses
+            record.winner = table.opponent(program_number)
+            break
+        table.cache.prune(table.moves_count)
+        if table.is_win(program_number, move.point):
+            record.winner = program_number
+            break
+    return record
+
+
+def _play(args: tuple) -> GameRecord:
+    return play_game(*args)
+
+
+class ShardWriter:
+    def __init__(self, directory: str, size: int, shard_size: int = 4096):
+        """
+        Write positions of games into compressed `.npz` shards of about `shard_size` positions each.
+        A shard is written only with whole games, and `manifest.json` lists the games of each written shard,
+        so that interrupted generation can be resumed from the games not written yet.
+        Each shard has arrays of positions:
+        `boards` int8 [n, 2, size, size] of stones of the player to move and the opponent,
+        `players` int8 [n] program_number to move (1 is black), `moves` int16 [n] of `y * size + x`,
+        `scores` int64 [n], `results` int8 [n] of 1 if the player to move won, -1 if lost and 0 for draw,
+        and `games` int32 [n] of the index of the game.
+        :param directory: directory of shards. created if not exists
+        :param size: size of the table
+        :param shard_size: positions per shard. at most this many positions and a game are kept in memory
+        """
+        if np is None:
+            raise ImportError('numpy is required to write shards')
+        self.directory = directory
+        self.size = size
+        self.shard_size = shard_size
+        self.pending: List[GameRecord] = []
+        self.pending_positions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = read_manifest(directory)
+        if self.manifest['size'] is None:
+            self.manifest['size'] = size
+        elif self.manifest['size'] != size:
+            raise ValueError('shards in {} are of size {}, not {}'.format(directory, self.manifest['size'], size))
+
+    @property
+    def done(self) -> Set[int]:
+        """
+        indexes of the games already written
+        """
+        return set(index for shard in self.manifest['shards'] for index in shard['games'])
+
+    def add(self, record: GameRecord):
+        """
+        add a game, and write a shard if enough positions are pending
+        :param record: game to add
+        """
+        self.pending.append(record)
+        self.pending_positions += len(record.moves)
+        if self.pending_positions >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        write pending games into a new shard
+        """
+        if not self.pending:
+            return
+        size = self.size
+        n = self.pending_positions
+        cells = np.frombuffer(b''.join(board for record in self.pending for board in record.boards),
+                              dtype=np.int8).reshape(n, size, size)
+        players = np.array([player for record in self.pending for player in record.players], dtype=np.int8)
+        results = np.array([0 if not record.winner else 1 if player == record.winner else -1
+                            for record in self.pending for player in record.players], dtype=np.int8)
+        arrays = {
+            'boards': np.stack([cells == 1, cells == 2], axis=1).astype(np.int8),
+            'players': players,
+            'moves': np.array([move for record in self.pending for move in record.moves], dtype=np.int16),
+            'scores': np.array([score for record in self.pending for score in record.scores], dtype=np.int64),
+            'results': results,
+            'games': np.array([record.index for record in self.pending for _ in record.moves], dtype=np.int32),
+        }
+
+        name = 'shard-{:05d}.npz'.format(len(self.manifest['shards']))
+        path = os.path.join(self.directory, name)
+        # the shard is complete before the manifest knows it
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(path + '.tmp', path)
+        self.manifest['shards'].append({'file': name, 'positions': n,
+                                        'games': [record.index for record in self.pending]})
+        write_manifest(self.directory, self.manifest)
+        self.pending = []
+        self.pending_positions = 0
+
+
+def read_manifest(directory: str) -> dict:
+    """
+    read `manifest.json` of the directory
+    :param directory: directory of shards
+    :return: dict of `size` and `shards`. empty one if there is no manifest
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'size': None, 'shards': []}
+
+
+def write_manifest(directory: str, manifest: dict):
+    """
+    write `manifest.json` of the directory atomically
+    """
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def generate(directory: str, games: int, processes: int = None, depth: int = 2, best: int = 3, size: int = None,
+             opening: int = 4, max_moves: int = None, shard_size: int = 4096, seed: int = 0) -> int:
+    """
+    play `games` self-play games on a process pool and write them into shards of `ShardWriter`.
+    games already in the directory are skipped, so it continues after interruption
+    :param directory: directory of shards
+    :param games: how many games in total
+    :param processes: number of worker processes. defaults to the number of CPUs. 0 to play in this process
+    :param depth: depth of `choose_next_move`
+    :param best: best of `choose_next_move`
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :param opening: how many random moves each game starts with
+    :param max_moves: games are draws after this many moves. defaults to all cells
+    :param shard_size: positions per shard
+    :param seed: seed of the openings
+    :return: int. how many games are played
+    """
+    size = size or config.TABLE_SIZE
+    writer = ShardWriter(directory, size, shard_size)
+    done = writer.done
+    tasks = [(index, depth, best, size, opening, max_moves, seed) for index in range(games) if index not in done]
+    if processes == 0:
+        for record in map(_play, tasks):
+            writer.add(record)
+    else:
+        with Pool(processes) as pool:
+            for record in pool.imap_unordered(_play, tasks):
+                writer.add(record)
+    writer.flush()
+    return len(tasks)
+
+
+def load_shards(directory: str) -> Iterator[dict]:
+    """
+    read shards of the directory one by one, in the order of the manifest
+    :param directory: directory of shards
+    :return: Iterator[dict]. arrays of each shard. see `ShardWriter`
+    """
+    if np is None:
+        raise ImportError('numpy is required to read shards')
+    for shard in read_manifest(directory)['shards']:
+        with np.load(os.path.join(directory, shard['file'])) as data:
+            yield {key: data[key] for key in data.files}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write self-play games as training data')
+    parser.add_argument('directory', help='directory of shards. generation continues if it already has shards')
+    parser.add_argument('--games', type=int, default=100, help='how many games in total')
+    parser.add_argument('--processes', type=int, help='number of worker processes. defaults to the number of CPUs')
+    parser.add_argument('--depth', type=int, default=2, help='depth of the search')
+    parser.add_argument('--best', type=int, default=3, help='width of the search')
+    parser.add_argument('--size', type=int, help='size of the table. defaults to `config.TABLE_SIZE`')
+    parser.add_argument('--opening', type=int, default=4, help='how many random moves each game starts with')
+    parser.add_argument('--max-moves', type=int, help='games are draws after this many moves')
+    parser.add_argument('--shard-size', type=int, default=4096, help='positions per shard')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the openings')
+    args = parser.parse_args()
+
+    played = generate(args.directory, args.games, args.processes, args.depth, args.best, args.size, args.opening,
+                      args.max_moves, args.shard_size, args.seed)
+    print('played {} games into {}'.format(played, args.directory))
@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict
+
+from engine import Engine, ProtocolError, move_from_json
+from main import *
+
+# shared by all games searched in this process. each worker process has its own
+_cache = SearchCache()
+# engines of the games searched in this process by the key of the session, the least recently used first
+_engines: 'OrderedDict[int, Engine]' = OrderedDict()
+
+
+def _go(key: int, size: int, moves: List[list], command: dict) -> dict:
+    """
+    run `go` of a game on a worker. the engine of the game is kept, so only the moves played since its last
+    search on this worker are placed. the table is built again if the moves were taken back
+    :param key: key of the session
+    :param size: size of the table
+    :param moves: moves of the game in the form of the protocol
+    :param command: `go` command
+    :return: response of `Engine.cmd_go`, with `worker` (the process id) and `cache` (`SearchCache.info` of it)
+    """
+    engine = _engines.pop(key, None)
+    if engine is not None:
+        played = [move_from_json(move) for move in moves]
+        table = engine.table
+        if table.size != size or table.moves != played[:table.moves_count] or \
+                any(table.compute_move(move) for move in played[table.moves_count:]):
+            engine = None
+    if engine is None:
+        engine = Engine(size)
+        engine.table.cache = _cache
+        engine.cmd_new({'moves': moves})
+    _engines[key] = engine
+    while len(_engines) > config.WORKER_ENGINES:
+        _engines.popitem(last=False)
+    response = engine.cmd_go(command)
+    response.update(worker=os.getpid(), cache=_cache.info())
+    return response
+
+
+class Session:
+    keys = itertools.count()
+
+    def __init__(self, engine: Engine, time_budget: float = None):
+        """
+        Single game of the service
+        :param engine: engine which keeps the table of the game
+        :param time_budget: seconds for all searches of the game. None for no limit
+        """
+        self.engine = engine
+        self.key = next(self.keys)  # unique in the service, even if the name of a game is used again
+        self.remaining = time_budget
+        self.lock = asyncio.Lock()  # commands of a game run one by one
+
+
+class Service:
+    def __init__(self, processes: int = None, max_sessions: int = 1000, max_pending: int = None, size: int = None):
+        """
+        Engine service for many games at once. Each command of `engine.Engine` has `game` to choose the session,
+        and `go` of all games are searched on a shared pool of workers, which keep caches through games and tables
+        of recent games. when a worker dies, the pool is replaced and the searches on it fail.
+        `go` is rejected as busy when `max_pending` searches are already waiting, and a client isn't read
+        until its command is answered, so that clients can't queue more than the pool can do.
+        :param processes: number of worker processes. defaults to the number of CPUs. 0 to search in threads
+        :param max_sessions: how many games can be open
+        :param max_pending: how many searches can be running or waiting. defaults to 4 times of the workers
+        :param size: default size of tables
+        """
+        workers = processes or os.cpu_count() or 1
+        self.processes = processes
+        self.executor: Executor = self.create_executor()
+        self.sessions: Dict[str, Session] = {}
+        self.max_sessions = max_sessions
+        self.max_pending = 4 * workers if max_pending is None else max_pending
+        self.pending = 0
+        self.size = size
+        # `SearchCache.info` of each worker by its process id, as of its last search
+        self.caches: Dict[int, dict] = {}
+
+    async def handle(self, command: dict) -> dict:
+        """
+        execute single command
+        :param command: parsed command
+        :return: response
+        """
+        try:
+            if not isinstance(command, dict):
+                raise ProtocolError('command must be an object')
+            game = str(command.get('game', 'default'))
+            cmd = command.get('cmd')
+            if cmd == 'new':
+                response = self.new(game, command)
+            elif cmd == 'close':
+                if self.sessions.pop(game, None) is None:
+                    raise ProtocolError('unknown game: {!r}'.format(game))
+                response = {'ok': True}
+            elif cmd == 'quit':
+                response = {'ok': True, 'quit': True}
+            else:
+                session = self.sessions.get(game)
+                if session is None:
+                    raise ProtocolError('unknown game: {!r}'.format(game))
+                async with session.lock:
+                    if cmd == 'go':
+                        response = await self.go(session, command)
+                    else:
+                        response = session.engine.handle({k: v for k, v in command.items() if k != 'id'})
+                        if cmd == 'stats':
+                            # searches run on the workers, so the cache of the engine here is never used
+                            del response['cache']
+                            response.update(remaining=session.remaining, games=len(self.sessions),
+                                            pending=self.pending, caches=list(self.caches.values()))
+        except (ValueError, TypeError) as e:
+            response = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            # e.g. a worker died. the service goes on for the other commands
+            response = {'ok': False, 'error': 'internal error: {}: {}'.format(type(e).__name__, e)}
+        if isinstance(command, dict):
+            for key in ('id', 'game'):
+                if key in command:
+                    response[key] = command[key]
+        return response
+
+    def create_executor(self) -> Executor:
+        """
+        create the pool of workers
+        :return: Executor
+        """
+        if self.processes == 0:
+            return ThreadPoolExecutor(os.cpu_count() or 1)
+        return ProcessPoolExecutor(self.processes)
+
+    def new(self, game: str, command: dict) -> dict:
+        """
+        start a game. `{"cmd": "new", "game": "g1", "time_budget": 60}` with the arguments of `Engine.cmd_new`
+        """
+        if game not in self.sessions and len(self.sessions) >= self.max_sessions:
+            raise ProtocolError('too many games')
+        engine = Engine(command.get('size', self.size))
+        response = engine.handle({'cmd': 'new', **{k: v for k, v in command.items() if k in ('size', 'moves')}})
+        if response['ok']:
+            time_budget = command.get('time_budget')
+            self.sessions[game] = Session(engine, None if time_budget is None else float(time_budget))
+        return response
+
+    async def go(self, session: Session, command: dict) -> dict:
+        """
+        search on the pool with the arguments of `Engine.cmd_go`. with the time budget of the game,
+        the search is limited by the remaining time, and takes a tenth of it if `time` isn't given
+        """
+        if self.pending >= self.max_pending:
+            raise ProtocolError('busy')
+        play = command.get('play')
+        command = {k: v for k, v in command.items() if k in ('depth', 'best', 'time', 'program_number')}
+        if session.remaining is not None:
+            if session.remaining <= 0:
+                raise ProtocolError('time budget is exhausted')
+            command['time'] = min(float(command.get('time', session.remaining / 10)), session.remaining)
+
+        table = session.engine.table
+        moves = [[move.program_number, move.point.y + config.TABLE_STARTS_WITH_ONE,
+                  move.point.x + config.TABLE_STARTS_WITH_ONE] for move in table.moves]
+        self.pending += 1
+        start = time.perf_counter()
+        executor = self.executor
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(executor, _go, session.key, table.size,
+                                                                        moves, command)
+        except BrokenExecutor:
+            # a worker died and the pool can't run anything. the next searches go to a new one
+            if self.executor is executor:
+                self.executor = self.create_executor()
+                self.caches.clear()
+                executor.shutdown(wait=False)
+            raise
+        finally:
+            self.pending -= 1
+        self.caches[response.pop('worker')] = response.pop('cache')
+        session.engine.last_search = response['time']
+        response['ok'] = True
+        response['wait'] = time.perf_counter() - start - response['time']
+        if session.remaining is not None:
+            session.remaining -= response['time']
+            response['remaining'] = session.remaining
+        if play:
+            response.update(session.engine.cmd_play(response['move']))
+        return response
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        read commands of a client line by line and write responses, until `quit` or EOF
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    command = json.loads(line)
+                except ValueError as e:
+                    response = {'ok': False, 'error': 'invalid json: {}'.format(e)}
+                else:
+                    response = await self.handle(command)
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+                if response.get('quit'):
+                    break
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0, path: str = None) -> asyncio.AbstractServer:
+        """
+        start listening on TCP `host:port`, or on Unix socket `path` if given
+        :return: asyncio.AbstractServer
+        """
+        if path:
+            return await asyncio.start_unix_server(self.serve, path)
+        return await asyncio.start_server(self.serve, host, port)
+
+    def close(self):
+        """
+        shut down the workers
+        """
+        self.executor.shutdown(cancel_futures=True)
+
+
+async def main(args: argparse.Namespace):
+    service = Service(args.processes, args.max_sessions, args.max_pending, args.size)
+    server = await service.start(args.host, args.port, args.unix)
+    print('listening on', args.unix or server.sockets[0].getsockname())
+    try:
+        await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Renju engine service for many games')
+    parser.add_argument('--host', default='127.0.0.1', help='host to listen on. defaults to 127.0.0.1')
+    parser.add_argument('--port', type=int, default=7007, help='port to listen on. defaults to 7007')
+    parser.add_argument('--unix', help='path of Unix socket to listen on instead of TCP')
+    parser.add_argument('--processes', type=int, help='number of worker processes. defaults to the number of CPUs')
+    parser.add_argument('--max-sessions', type=int, default=1000, help='how many games can be open')
+    parser.add_argument('--max-pending', type=int, help='how many searches can be waiting')
+    parser.add_argument('--size', type=int, help='size of the table. defaults to `config.TABLE_SIZE`')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,149 @@
+import argparse
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Union
+
+from engine import Engine
+from main import *
+
+TACTICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tactics.txt')
+
+
+@dataclass
+class Tactic:
+    """
+    Position with known correct moves
+    :param name: name of the position
+    :param category: kind of the position. e.g. `forced win`, `must block`, `foul trap`
+    :param answers: correct points. any of them solves the position
+    :param moves: moves of the position
+    """
+    name: str
+    category: str
+    answers: List[Point]
+    moves: List[Move]
+
+
+@dataclass
+class TacticResult:
+    """
+    Result of a search on a Tactic
+    :param tactic: searched position
+    :param budget: `depth N` or `time Ns`
+    :param move: chosen move
+    :param solved: whether `move` is one of the answers
+    :param time: seconds taken
+    :param nodes: points evaluated by `score_point`
+    :param depth: depth of the result
+    """
+    tactic: Tactic
+    budget: str
+    move: Move
+    solved: bool
+    time: float
+    nodes: int
+    depth: int
+
+
+def load_tactics(filename: str = TACTICS_FILE) -> List[Tactic]:
+    """
+    Load positions from file. each line is `name<TAB>category<TAB>answers<TAB>moves`,
+    answers are `y;x` separated by spaces, moves are in the format of data file. lines starting with `#` are ignored.
+    :param filename: file of positions
+    :return: List[Tactic]
+    """
+    tactics = []
+    with open(filename) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            try:
+                name, category, answers, data = line.rstrip('\n').split('\t')
+                points = [Point(*(int(v) - config.TABLE_STARTS_WITH_ONE for v in answer.split(';')))
+                          for answer in answers.split()]
+            except (TypeError, ValueError):
+                raise ValueError('invalid line: {!r}'.format(line))
+            tactics.append(Tactic(name, category, points, parse_data(data)[1]))
+    return tactics
+
+
+def solve(tactic: Tactic, depth: int = None, time_limit: float = None, best: int = 3, size: int = None) -> TacticResult:
+    """
+    search the position with empty caches, by `depth` or by iterative deepening for `time_limit` seconds
+    :param tactic: position to search
+    :param depth: depth of `choose_next_move`
+    :param time_limit: seconds for `Engine.search_timed`. used if depth isn't given
+    :param best: best of `choose_next_move`
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :return: TacticResult
+    """
+    find_options_cache.clear()
+    engine = Engine(size)
+    engine.cmd_new({'moves': [[move.program_number, move.point.y + config.TABLE_STARTS_WITH_ONE,
+                               move.point.x + config.TABLE_STARTS_WITH_ONE] for move in tactic.moves]})
+    table = engine.table
+    evaluations = table.cache.evaluations
+    start = time.perf_counter()
+    if depth is not None:
+        move, _ = table.choose_next_move(table.me, depth, best)
+        budget = 'depth {}'.format(depth)
+    else:
+        move, _, depth = engine.search_timed(table.me, time_limit, best, 8)
+        budget = 'time {}s'.format(time_limit)
+    return TacticResult(tactic, budget, move, move.point in tactic.answers, time.perf_counter() - start,
+                        table.cache.evaluations - evaluations, depth)
+
+
+def run_tactics(tactics: Iterable[Tactic], depths: Iterable[int] = (1, 2, 3), time_limits: Iterable[float] = (),
+                best: int = 3, size: int = None) -> Iterator[TacticResult]:
+    """
+    solve each position with each budget
+    :param tactics: positions to search
+    :param depths: depths to search
+    :param time_limits: seconds to search
+    :param best: best of `choose_next_move`
+    :param size: size of the table. defaults to `config.TABLE_SIZE`
+    :return: Iterator[TacticResult]
+    """
+    depths, time_limits = list(depths), list(time_limits)
+    for tactic in tactics:
+        for depth in depths:
+            yield solve(tactic, depth, None, best, size)
+        for time_limit in time_limits:
+            yield solve(tactic, None, time_limit, best, size)
+
+
+def report(results: Iterable[TacticResult]) -> str:
+    """
+    format results per position and in aggregate per budget
+    :param results: results of `run_tactics`
+    :return: str
+    """
+    lines = ['{:<20}{:<14}{:<11}{:<7}{:>9}{:>8}  {}'.format('name', 'category', 'budget', 'solved', 'time', 'nodes',
+                                                            'move')]
+    total: Dict[str, List[Union[int, float]]] = {}
+    for result in results:
+        move = result.move.point
+        lines.append('{:<20}{:<14}{:<11}{:<7}{:>9.3f}{:>8}  {};{}'.format(
+            result.tactic.name, result.tactic.category, result.budget, 'yes' if result.solved else 'NO',
+            result.time, result.nodes, move.y + config.TABLE_STARTS_WITH_ONE, move.x + config.TABLE_STARTS_WITH_ONE))
+        solved, count, seconds, nodes = total.get(result.budget, [0, 0, 0.0, 0])
+        total[result.budget] = [solved + result.solved, count + 1, seconds + result.time, nodes + result.nodes]
+
+    lines.append('')
+    for budget, (solved, count, seconds, nodes) in total.items():
+        lines.append('{:<11}solved {}/{}, {:.3f}s, {} nodes'.format(budget, solved, count, seconds, nodes))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solve tactical positions and report time and nodes')
+    parser.add_argument('filename', nargs='?', default=TACTICS_FILE, help='file of positions. defaults to tactics.txt')
+    parser.add_argument('--depth', type=int, nargs='*', default=[1, 2, 3], help='depths to search. defaults to 1 2 3')
+    parser.add_argument('--time', type=float, nargs='*', default=[], help='seconds to search by iterative deepening')
+    parser.add_argument('--best', type=int, default=3, help='best of `choose_next_move`')
+    parser.add_argument('--size', type=int, help='size of the table. defaults to `config.TABLE_SIZE`')
+    args = parser.parse_args()
+
+    print(report(run_tactics(load_tactics(args.filename), args.depth, args.time, args.best, args.size)))
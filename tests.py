@@ -1,7 +1,31 @@
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from contextlib import redirect_stdout
+from itertools import islice
+from typing import List
 
 import config
-from main import (Table, Move, Point, load_data, write_data, Line, Direction)
+from analysis import evaluate_positions, analyse_game
+from archive import PositionIndex, canonical_hash
+from cluster import Coordinator, record_from_json, validate_archive, work
+from engine import Engine
+from gui import cell_at, cell_center
+from mcts import MCTS, rollout
+from profiling import Profiler
+from selfplay import generate, load_shards, np, play_game, read_manifest
+from service import Service, _engines, _go
+from tactics import load_tactics, run_tactics, report
+from main import (Table, Move, Point, load_data, write_data, Line, Direction, Ponderer, SearchAborted, UNBOUNDED,
+                  save_state, load_state, OptionType, find_options_cache, Journal, parse_data, ray)
 
 
 class TestIO(unittest.TestCase):
@@ -81,6 +105,147 @@ class TestIO(unittest.TestCase):
             actual = f.read()
         self.assertEqual('0,', actual)
 
+    def test_state_continued(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 7)), Move(1, Point(7, 6))]
+        table = Table(moves[:2])
+        table.compute()
+        table.choose_next_move(1)
+        save_state('tmp', table)
+
+        actual, validated = load_state('tmp', moves[:])
+        self.assertEqual(2, validated)
+        self.assertEqual(table.table, actual.table)
+        self.assertEqual(table.hash, actual.hash)
+        # searched results aren't saved
+        self.assertEqual(0, len(actual.cache))
+        self.assertEqual((None, None), actual.compute(validated))
+        self.assertEqual(1, actual.table[Point(7, 6)])
+
+    def test_state_mismatch(self):
+        table = Table([Move(1, Point(7, 7)), Move(2, Point(6, 7))])
+        table.compute()
+        save_state('tmp', table)
+        actual, validated = load_state('tmp', [Move(1, Point(7, 7)), Move(2, Point(6, 6))])
+        self.assertEqual(0, validated)
+        self.assertEqual({}, actual.table)
+
+        with open('tmp' + config.STATE_SUFFIX, 'w') as f:
+            f.write('broken')
+        self.assertEqual(0, load_state('tmp', table.moves)[1])
+
+        # an old state with a board, or a count which doesn't match the digest
+        save_state('tmp', table)
+        with open('tmp' + config.STATE_SUFFIX) as f:
+            state = json.load(f)
+        for changed in ({'version': 2, 'table': [[7, 7, 1], [6, 6, 2]]}, {'moves_count': 1}, {'moves_count': '2'}):
+            with open('tmp' + config.STATE_SUFFIX, 'w') as f:
+                json.dump(dict(state, **changed), f)
+            self.assertEqual(0, load_state('tmp', table.moves)[1])
+        with open('tmp' + config.STATE_SUFFIX, 'w') as f:
+            json.dump(state, f)
+        actual, validated = load_state('tmp', table.moves)
+        self.assertEqual(2, validated)
+        self.assertEqual(table.table, actual.table)
+        self.assertEqual(table.hash, actual.hash)
+
+    def test_cli_resume_won(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data.txt')
+            with open(path, 'w') as f:
+                f.write('8,1;8;4,2;7;4,1;8;5,2;7;5,1;8;6,2;7;6,1;8;7,2;1;1')
+            script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+            outputs = [subprocess.run([sys.executable, script, path], capture_output=True, text=True, timeout=60)
+                       for _ in range(2)]
+            for process in outputs:
+                self.assertEqual(0, process.returncode, process.stderr)
+            self.assertIn('win', outputs[0].stdout)
+            self.assertIn('won by placing', outputs[1].stdout)
+            self.assertNotIn('chose move:', outputs[1].stdout)
+            self.assertEqual(9, load_data(path)[0])
+
+    def test_cli_unbounded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data.txt')
+            with open(path, 'w') as f:
+                f.write('3,1;8;8,2;7;9,1;9;7')
+            script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+            process = subprocess.run([sys.executable, script, '--size', '0', path], capture_output=True, text=True,
+                                     timeout=60)
+            self.assertEqual(0, process.returncode, process.stderr)
+            self.assertIn('chose move:', process.stdout)
+            self.assertEqual(4, load_data(path)[0])
+
+            # same bounds as `new` of the engine
+            for size in ('3', '101'):
+                process = subprocess.run([sys.executable, script, '--size', size, path], capture_output=True,
+                                         text=True, timeout=60)
+                self.assertEqual(2, process.returncode)
+                self.assertIn('--size must be 0 or from 5', process.stderr)
+
+    def test_journal(self):
+        self.addCleanup(os.remove, 'tmp' + config.JOURNAL_SUFFIX)
+        self.addCleanup(os.remove, 'tmp' + config.JOURNAL_SUFFIX + '.lock')
+        moves = [Move(1 + i % 2, Point(7, i)) for i in range(7)]
+        write_data('tmp', Table(moves[:2]))
+        journal = Journal('tmp', compact_size=3)
+        self.assertEqual(moves[:2], journal.load())
+        for move in moves[2:]:
+            journal.append(move)
+        # compacted after 3 records
+        with open('tmp') as f:
+            self.assertEqual((5, moves[:5]), parse_data(f.read()))
+        self.assertEqual((7, moves), load_data('tmp'))
+
+        # torn record is ignored, and dropped by the next append
+        with open('tmp' + config.JOURNAL_SUFFIX, 'a') as f:
+            f.write('7,1;8;8,0')
+        self.assertEqual((7, moves), load_data('tmp'))
+        Journal('tmp').append(Move(1, Point(0, 0)))
+        self.assertEqual((8, moves + [Move(1, Point(0, 0))]), load_data('tmp'))
+
+    def test_journal_writers(self):
+        self.addCleanup(os.remove, 'tmp' + config.JOURNAL_SUFFIX)
+        self.addCleanup(os.remove, 'tmp' + config.JOURNAL_SUFFIX + '.lock')
+        write_data('tmp', Table([]))
+        moves = [Move(1 + i % 2, Point(i // 15, i % 15)) for i in range(60)]
+
+        def write(moves: List[Move]):
+            journal = Journal('tmp', compact_size=7)
+            for move in moves:
+                journal.append(move)
+
+        # each writer records after the moves of the other one, not over them
+        writers = [threading.Thread(target=write, args=(moves[i::2],)) for i in range(2)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        count, actual = load_data('tmp')
+        self.assertEqual(60, count)
+        self.assertCountEqual(moves, actual)
+
+    def test_journal_mismatch(self):
+        self.addCleanup(os.remove, 'tmp' + config.JOURNAL_SUFFIX)
+        self.addCleanup(os.remove, 'tmp' + config.JOURNAL_SUFFIX + '.lock')
+        moves = [Move(1 + i % 2, Point(7, i)) for i in range(3)]
+        write_data('tmp', Table(moves[:1]))
+        journal = Journal('tmp')
+        journal.append(moves[1])
+        journal.append(moves[2])
+        # broken checksum
+        with open('tmp' + config.JOURNAL_SUFFIX) as f:
+            data = f.read()
+        with open('tmp' + config.JOURNAL_SUFFIX, 'w') as f:
+            f.write(data.replace('2,1;8;3', '2,1;8;4'))
+        self.assertEqual((2, moves[:2]), load_data('tmp'))
+
+        # the data file is rewritten with another game
+        write_data('tmp', Table([Move(1, Point(0, 0))]))
+        self.assertEqual((1, [Move(1, Point(0, 0))]), load_data('tmp'))
+        # or with all moves
+        write_data('tmp', Table(moves[:]))
+        self.assertEqual((3, moves), load_data('tmp'))
+
 
 class TestLine(unittest.TestCase):
 
@@ -169,6 +334,84 @@ class TestTable(unittest.TestCase):
         actual = table.is_win(2)
         self.assertEqual(False, actual)
 
+    def test_is_win_local(self):
+        table = Table([Move(1, Point(0, 0)), Move(2, Point(14, 14))])
+        table.compute()
+        for x in range(3, 9):
+            table.place(Move(1, Point(7, x)))
+            table.place(Move(2, Point(9, x)))
+        # overline isn't a win for black
+        self.assertEqual(False, table.is_win(1, Point(7, 8)))
+        self.assertEqual(True, table.is_win(2, Point(9, 8)))
+        self.assertEqual(False, table.is_win(2, Point(7, 8)))
+        self.assertEqual(False, table.is_win(2, Point(8, 8)))
+
+    def test_rays(self):
+        self.assertEqual((Point(7, 6), Point(7, 5), Point(7, 4), Point(7, 3), Point(7, 2), Point(7, 1), Point(7, 0)),
+                         ray(Point(7, 7), Direction.Horizontal, False, 15))
+        self.assertEqual((Point(13, 1), Point(14, 0)), ray(Point(12, 2), Direction.Diagonal_UR_BL, True, 15))
+        self.assertEqual((), ray(Point(0, 0), Direction.Vertical, False, 15))
+        self.assertEqual((), ray(Point(0, 17), Direction.Horizontal, True, 15))
+        self.assertEqual(Point(99, 30), ray(Point(50, 79), Direction.Diagonal_UR_BL, True, 100)[-1])
+        self.assertEqual(49, len(ray(Point(50, 79), Direction.Diagonal_UR_BL, True, 100)))
+        self.assertEqual([Point(-1, -1), Point(-2, -2)],
+                         list(islice(ray(Point(0, 0), Direction.Diagonal_UL_BR, False, UNBOUNDED), 2)))
+
+        table = Table([Move(1, Point(7, 7)), Move(2, Point(0, 0)), Move(1, Point(7, 8)), Move(2, Point(0, 1)),
+                       Move(1, Point(8, 8))])
+        table.compute()
+        for size in (15, UNBOUNDED):
+            table.size = size
+            self.assertEqual([table.run_length(Move(1, Point(7, 9)), direction) for direction in Direction],
+                             table.run_lengths(Point(7, 9), 1))
+            self.assertEqual([3, 1, 1, 2], table.run_lengths(Point(7, 9), 1))
+
+    @staticmethod
+    def foul_table(black: list, white: list, size: int = 15) -> Table:
+        table = Table([Move(1, Point(0, 0)), Move(2, Point(14, 14))], size)
+        table.compute()
+        for y, x in black:
+            table.place(Move(1, Point(y, x)))
+        for y, x in white:
+            table.place(Move(2, Point(y, x)))
+        return table
+
+    def test_foul_split_three(self):
+        for size in (15, UNBOUNDED):
+            # XX_T and T_XX
+            table = self.foul_table([(7, 4), (7, 5), (8, 7), (10, 7)], [], size)
+            self.assertEqual(True, table.check_foul(Move(1, Point(7, 7))))
+            self.assertEqual(False, table.check_foul(Move(2, Point(7, 7))))
+
+    def test_foul_split_four(self):
+        # XX_TX and XXXT
+        table = self.foul_table([(7, 4), (7, 5), (7, 8), (4, 7), (5, 7), (6, 7)], [])
+        self.assertEqual(True, table.check_foul(Move(1, Point(7, 7))))
+        # X_XTX_X has two fours in a line
+        table = self.foul_table([(7, 3), (7, 5), (7, 7), (7, 9)], [])
+        self.assertEqual(True, table.check_foul(Move(1, Point(7, 6))))
+        # four-three is allowed
+        table = self.foul_table([(7, 4), (7, 5), (7, 6), (8, 7), (9, 7)], [])
+        self.assertEqual(False, table.check_foul(Move(1, Point(7, 7))))
+
+    def test_foul_overline(self):
+        table = self.foul_table([(7, 3), (7, 4), (7, 5), (7, 7), (7, 8)], [])
+        self.assertEqual(True, table.check_foul(Move(1, Point(7, 6))))
+        # five wins even if it makes overline too
+        table = self.foul_table([(7, 3), (7, 4), (7, 5), (7, 7), (7, 8), (3, 6), (4, 6), (5, 6), (6, 6)], [(2, 6)])
+        self.assertEqual(False, table.check_foul(Move(1, Point(7, 6))))
+
+    def test_foul_fake_three(self):
+        # WXXT_W can't be a straight four
+        table = self.foul_table([(7, 5), (7, 6), (8, 7), (9, 7)], [(7, 4), (7, 9)])
+        self.assertEqual(False, table.check_foul(Move(1, Point(7, 7))))
+        # W__XXT_W is a three
+        table = self.foul_table([(7, 5), (7, 6), (8, 7), (9, 7)], [(7, 2), (7, 9)])
+        self.assertEqual(True, table.check_foul(Move(1, Point(7, 7))))
+        # but not if its straight four is made by a foul move
+        table = self.foul_table([(7, 5), (7, 6), (8, 7), (9, 7), (4, 4), (5, 4), (6, 4)], [(7, 2), (7, 9)])
+        self.assertEqual(False, table.check_foul(Move(1, Point(7, 7))))
+
     def test_table_compute_success(self):
         moves = [Move(1, Point(7, 7)), Move(2, Point(6, 7)), Move(1, Point(7, 6)), Move(2, Point(6, 6))]
         table = Table(moves)
@@ -201,6 +444,42 @@ class TestTable(unittest.TestCase):
         actual = table.compute()
         self.assertEqual((Move(1, Point(7, 3)), True), actual)
 
+    def test_table_size(self):
+        line = Line(Direction.Horizontal, Point(0, 17), Point(0, 17), 1)
+        self.assertEqual((None, None, False), line.extend_second())
+        self.assertEqual(Point(0, 18), line.extend_second(19)[1])
+        self.assertEqual((None, None, False), Line(Direction.Horizontal, Point(0, 18), Point(0, 18), 1)
+                         .extend_second(19))
+        self.assertEqual(Point(0, -1), Line(Direction.Horizontal, Point(0, 0), Point(0, 0), 1)
+                         .extend_first(UNBOUNDED)[1])
+
+    def test_table_center(self):
+        self.assertEqual(Move(1, Point(9, 9)), Table([], 19).choose_next_move(1)[0])
+        self.assertEqual(Move(1, Point(0, 0)), Table([], UNBOUNDED).choose_next_move(1)[0])
+
+    def test_table_unbounded_win(self):
+        moves = [Move(1, Point(0, -y)) if i % 2 == 0 else Move(2, Point(1, -y)) for y in range(5) for i in range(2)]
+        table = Table(moves[:-1], UNBOUNDED)
+        actual = table.compute()
+        self.assertEqual((Move(1, Point(0, -4)), True), actual)
+
+    def test_table_unbounded_pretty_print(self):
+        table = Table([Move(1, Point(-3, 40)), Move(2, Point(-2, 41))], UNBOUNDED)
+        table.compute()
+        with redirect_stdout(io.StringIO()) as f:
+            table.pretty_print()
+        self.assertEqual(1 + 6 * 2 - 1, len(f.getvalue().splitlines()))
+
+    def test_pretty_print_labels(self):
+        table = Table([Move(1, Point(0, 0))], 15)
+        table.compute()
+        self.addCleanup(setattr, config, 'TABLE_STARTS_WITH_ONE', config.TABLE_STARTS_WITH_ONE)
+        for starts_with_one, first in ((True, '①'), (False, ' 0')):
+            config.TABLE_STARTS_WITH_ONE = starts_with_one
+            with redirect_stdout(io.StringIO()) as f:
+                table.pretty_print()
+            self.assertTrue(f.getvalue().splitlines()[1].startswith(first))
+
 
 class TestMove(unittest.TestCase):
     def test_table_stop_opponent_win(self):
@@ -219,6 +498,738 @@ class TestMove(unittest.TestCase):
         actual = table.choose_next_move(1)
         self.assertIn(actual[0], [Move(1, Point(7, 3)), Move(1, Point(7, 8))])
 
+    def test_forced_move_win_before_block(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 7)), Move(1, Point(7, 6)), Move(2, Point(6, 6)),
+                 Move(1, Point(7, 5)), Move(2, Point(6, 5)), Move(1, Point(7, 4)), Move(2, Point(6, 4)),
+                 Move(1, Point(0, 0))]
+        table = Table(moves)
+        table.compute()
+        move, oc = table.find_forced_move(2)
+        self.assertIn(move, [Move(2, Point(6, 3)), Move(2, Point(6, 8))])
+        self.assertEqual(OptionType.Win, oc.max.type)
+
+    def test_forced_move_block_split_four(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(0, 0)), Move(1, Point(7, 6)), Move(2, Point(0, 2)),
+                 Move(1, Point(7, 4)), Move(2, Point(14, 14)), Move(1, Point(7, 3))]
+        table = Table(moves)
+        table.compute()
+        self.assertEqual(Move(2, Point(7, 5)), table.find_forced_move(2)[0])
+
+    def test_forced_move_open_four(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(0, 0)), Move(1, Point(7, 6)), Move(2, Point(0, 4)),
+                 Move(1, Point(7, 5)), Move(2, Point(14, 14))]
+        table = Table(moves)
+        table.compute()
+        move, oc = table.find_forced_move(1)
+        self.assertIn(move, [Move(1, Point(7, 4)), Move(1, Point(7, 8))])
+        self.assertEqual(OptionType.Checkmate, oc.max.type)
+
+    def test_forced_move_old_five(self):
+        # white's four isn't among the last moves, and wins before black's open four
+        rows = {0: '.2222..........', 1: '..........1....', 2: '............1..', 3: '.......1.......',
+                4: '.............1.', 7: '.....111.......', 14: '2.2.2..........'}
+        board = ''.join(rows.get(y, '.' * 15) for y in range(15))
+        table = Table.from_board(board)
+        self.assertIsNone(table.find_forced_move(1))
+        self.assertIn(table.choose_next_move(1)[0], [Move(1, Point(0, 0)), Move(1, Point(0, 5))])
+        evaluation = next(evaluate_positions([board], processes=0))
+        self.assertFalse(evaluation.forced_win)
+        self.assertIn(evaluation.move.point, [Point(0, 0), Point(0, 5)])
+
+    def test_local_score(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 6)), Move(1, Point(7, 8)), Move(2, Point(9, 9)),
+                 Move(1, Point(3, 3)), Move(2, Point(11, 4))]
+        table = Table(moves)
+        table.compute()
+        # _XXX_ and _XX_X_ are threats
+        self.assertEqual(True, table.local_score(1, Point(7, 6))[1])
+        self.assertEqual(True, table.local_score(1, Point(7, 10))[1])
+        self.assertEqual(False, table.local_score(1, Point(3, 4))[1])
+        self.assertGreater(table.local_score(1, Point(3, 4))[0], table.local_score(1, Point(0, 14))[0])
+
+    def test_rank_points_staged(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 6)), Move(1, Point(7, 8)), Move(2, Point(9, 9)),
+                 Move(1, Point(3, 3)), Move(2, Point(11, 4))]
+        table = Table(moves)
+        table.compute()
+        full = table.rank_points(1, 0)
+        staged = table.rank_points(1, 2)
+        self.assertLess(len(staged), len(full))
+        # threats are scored besides the best 2
+        self.assertEqual({Point(7, 5), Point(7, 6), Point(7, 9), Point(7, 10)}, {point for _, point in staged})
+        self.assertEqual(full[0][0].score, staged[0][0].score)
+
+    def test_choose_next_moves(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 6)), Move(1, Point(7, 8)), Move(2, Point(9, 9)),
+                 Move(1, Point(3, 3)), Move(2, Point(11, 4))]
+        table = Table(moves[:])
+        table.compute()
+        actual = table.choose_next_moves(1, depth=2, best=3, count=4)
+        self.assertEqual(table.choose_next_move(1, 2, 3)[0], actual[0].move)
+        self.assertEqual(4, len(set(variation.move for variation in actual)))
+        scores = [variation.score for variation in actual]
+        self.assertEqual(sorted(scores, reverse=True), scores)
+        for variation in actual:
+            self.assertEqual(variation.move, variation.pv[0])
+            self.assertEqual([1, 2][:len(variation.pv)], [move.program_number for move in variation.pv])
+        # _XXX_ is ToCheckmate
+        self.assertIn(Point(7, 6), [variation.move.point for variation in actual])
+        self.assertEqual(OptionType.ToCheckmate, actual[0].threat)
+
+    def test_choose_next_moves_cached(self):
+        table = Table([Move(1, Point(7, 7)), Move(2, Point(6, 8)), Move(1, Point(8, 6)), Move(2, Point(5, 5))])
+        table.compute()
+        move = table.choose_next_move(1, 2, 3)[0]
+        nodes = table.cache.nodes
+        actual = table.choose_next_moves(1, depth=2, best=3, count=3)
+        # the replies to the candidates are the ones searched by `choose_next_move`
+        self.assertEqual(nodes, table.cache.nodes)
+        self.assertEqual(move, actual[0].move)
+        self.assertEqual([2, 2, 2], [len(variation.pv) for variation in actual])
+
+    def test_choose_next_moves_opening(self):
+        table = Table([Move(1, Point(7, 7)), Move(2, Point(6, 7))])
+        table.compute()
+        actual = table.choose_next_moves(1, depth=2, best=3, count=4)
+        self.assertEqual(4, len(actual))
+        scores = [variation.score for variation in actual]
+        self.assertEqual(sorted(scores, reverse=True), scores)
+
+    def test_tie_break_seed(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 6)), Move(1, Point(7, 8)), Move(2, Point(9, 9)),
+                 Move(1, Point(3, 3)), Move(2, Point(11, 4))]
+        orders = []
+        for seed in [0, 0, 1]:
+            table = Table(moves[:])
+            table.compute()
+            table.seed = seed
+            orders.append([variation.move for variation in table.choose_next_moves(1, count=4)])
+        self.assertEqual(orders[0], orders[1])
+        # (7, 6) and (7, 9) have the same score
+        self.assertEqual(set(orders[0][:2]), set(orders[2][:2]))
+        self.assertNotEqual(orders[0], orders[2])
+
+    def test_threat_extension(self):
+        moves = [Move(1, Point(6, 4)), Move(2, Point(4, 7)), Move(1, Point(10, 9)), Move(2, Point(7, 4)),
+                 Move(1, Point(6, 10))]
+        table = Table(moves)
+        table.compute()
+        forcing = [point for oc, point in table.rank_points(2)[:3]
+                   if oc.max.type in (OptionType.Checkmate, OptionType.ToCheckmate)]
+        self.assertTrue(forcing)
+        table.choose_next_move(2, depth=2, best=3, extensions=1)
+        for point in forcing:
+            line = table.copy()
+            line.compute_move(Move(2, point))
+            line.compute_move(line.choose_next_move(1, 1, 3, 0)[0])
+            # the forcing move and the reply don't count against depth, but against extensions
+            self.assertIn(line.search_key(2, 2, 3, 0), table.cache.entries)
+
+        plain = Table(moves[:])
+        plain.compute()
+        plain.choose_next_move(2, depth=2, best=3, extensions=0)
+        self.assertLess(plain.cache.nodes, table.cache.nodes)
+
+    def test_forced_move_none(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 7)), Move(1, Point(7, 6)), Move(2, Point(6, 6))]
+        table = Table(moves)
+        table.compute()
+        self.assertIsNone(table.find_forced_move(1))
+
+
+class TestPonder(unittest.TestCase):
+    moves = [Move(1, Point(7, 7)), Move(2, Point(6, 8)), Move(1, Point(8, 6)), Move(2, Point(5, 5))]
+
+    def test_hash_follows_table(self):
+        table = Table(self.moves[:])
+        table.compute()
+        other = Table(list(reversed(self.moves)))
+        other.compute()
+        self.assertEqual(table.hash, other.hash)
+        self.assertEqual(table.hash, table.copy().hash)
+        self.assertNotEqual(table.hash, Table([]).hash)
+
+    def test_search_cached(self):
+        table = Table(self.moves[:])
+        table.compute()
+        expected = table.choose_next_move(1, depth=2, best=3)
+        nodes = table.cache.nodes
+        self.assertEqual(expected, table.choose_next_move(1, depth=2, best=3))
+        self.assertEqual(nodes, table.cache.nodes)
+
+    def test_ponder_reused(self):
+        table = Table(self.moves[:3])
+        table.compute()
+        ponderer = Ponderer(table, 1, depth=1, best=3, replies=1)
+        ponderer.run()
+        self.assertEqual(1, len(ponderer.pondered))
+
+        table.compute_move(ponderer.pondered[0])
+        nodes = table.cache.nodes
+        table.choose_next_move(1, depth=1, best=3)
+        self.assertEqual(nodes, table.cache.nodes)
+
+    def test_ponder_stop(self):
+        table = Table(self.moves[:3])
+        table.compute()
+        ponderer = Ponderer(table, 1)
+        ponderer.table.abort.set()
+        self.assertRaises(SearchAborted, ponderer.table.choose_next_move, 1)
+        ponderer.start().stop()
+        self.assertEqual([], ponderer.pondered)
+
+    def test_find_options_cached(self):
+        table = Table(self.moves[:] + [Move(1, Point(9, 5)), Move(2, Point(4, 4))])
+        table.compute()
+        lines = [line for lines in table.get_lines(1).values() for line in lines]
+        expected = [table._find_options(line).options for line in lines]
+        find_options_cache.clear()
+        self.assertEqual(expected, [table.find_options(line).options for line in lines])
+        self.assertEqual(expected, [table.find_options(line).options for line in lines])
+        self.assertGreaterEqual(find_options_cache.info()['hit_rate'], 0.5)
+
+    def test_find_options_cache_shared(self):
+        # same neighbourhood at a different place
+        table = Table([Move(1, Point(7, 7)), Move(2, Point(0, 0)), Move(1, Point(7, 8))])
+        table.compute()
+        other = Table([Move(1, Point(3, 4)), Move(2, Point(0, 0)), Move(1, Point(3, 5))])
+        other.compute()
+        find_options_cache.clear()
+        table.find_options(table.get_lines(1)[2][0])
+        misses = find_options_cache.misses
+        oc = other.find_options(other.get_lines(1)[2][0])
+        self.assertEqual(misses, find_options_cache.misses)
+        self.assertEqual({Point(3, 3), Point(3, 6)}, {option.point for option in oc.options})
+
+
+class TestEngine(unittest.TestCase):
+    def test_play_and_undo(self):
+        engine = Engine()
+        self.assertEqual({'ok': True, 'moves_count': 1, 'win': False, 'id': 1},
+                         engine.handle({'cmd': 'new', 'moves': [[1, 8, 8]], 'id': 1}))
+        self.assertEqual({'ok': True, 'foul': False, 'win': False, 'moves_count': 2},
+                         engine.handle({'cmd': 'play', 'y': 7, 'x': 8}))
+        self.assertEqual(2, engine.table.table[Point(6, 7)])
+        self.assertEqual({'ok': True, 'foul': True, 'win': False, 'moves_count': 2},
+                         engine.handle({'cmd': 'play', 'y': 7, 'x': 8}))
+
+        hash_ = engine.table.hash
+        engine.handle({'cmd': 'play', 'y': 9, 'x': 9})
+        self.assertEqual({'ok': True, 'undone': [{'program_number': 1, 'y': 9, 'x': 9}], 'moves_count': 2},
+                         engine.handle({'cmd': 'undo'}))
+        self.assertEqual(hash_, engine.table.hash)
+        self.assertFalse(engine.handle({'cmd': 'undo', 'count': 3})['ok'])
+
+        # no moves after a five
+        engine.handle({'cmd': 'new', 'moves': [[1, 8, 4], [2, 7, 4], [1, 8, 5], [2, 7, 5], [1, 8, 6], [2, 7, 6],
+                                               [1, 8, 7], [2, 1, 1]]})
+        self.assertTrue(engine.handle({'cmd': 'play', 'y': 8, 'x': 8})['win'])
+        response = engine.handle({'cmd': 'play', 'y': 7, 'x': 7})
+        self.assertFalse(response['ok'])
+        self.assertIn('the game is over', response['error'])
+        self.assertEqual(9, engine.table.moves_count)
+
+    def test_go(self):
+        engine = Engine()
+        engine.handle({'cmd': 'new', 'moves': [[1, 8, 8], [2, 7, 8], [1, 8, 7], [2, 7, 7], [1, 8, 6], [2, 7, 6],
+                                               [1, 8, 5]]})
+        actual = engine.handle({'cmd': 'go', 'depth': 2, 'play': True})
+        self.assertIn(actual['move'], [{'program_number': 2, 'y': 8, 'x': 4}, {'program_number': 2, 'y': 8, 'x': 9}])
+        self.assertEqual(8, actual['moves_count'])
+
+        actual = engine.handle({'cmd': 'go', 'time': 0.05})
+        self.assertTrue(actual['ok'])
+        self.assertGreaterEqual(actual['depth'], 1)
+
+        actual = engine.handle({'cmd': 'go', 'depth': 1, 'multipv': 3})
+        self.assertEqual(3, len(actual['variations']))
+        self.assertEqual(actual['move'], actual['variations'][0]['move'])
+        self.assertEqual(actual['move'], actual['variations'][0]['pv'][0])
+
+    def test_invalid_arguments(self):
+        engine = Engine()
+        engine.handle({'cmd': 'new', 'moves': [[1, 8, 8], [2, 7, 8], [1, 8, 7], [2, 7, 7], [1, 9, 9]]})
+        for command in [{'cmd': 'new', 'size': 'abc'}, {'cmd': 'new', 'size': -3}, {'cmd': 'new', 'size': 3},
+                        {'cmd': 'new', 'size': 1000}, {'cmd': 'new', 'moves': [[3, 1, 1]]},
+                        {'cmd': 'go', 'depth': 0}, {'cmd': 'go', 'depth': 3, 'best': 0}, {'cmd': 'go', 'time': -1},
+                        {'cmd': 'go', 'depth': 1.5}, {'cmd': 'go', 'program_number': 3},
+                        {'cmd': 'undo', 'count': -1}, {'cmd': 'play', 'program_number': 3, 'y': 1, 'x': 1}]:
+            response = engine.handle(command)
+            self.assertFalse(response['ok'], command)
+            self.assertIn('must be', response['error'])
+        self.assertEqual(5, engine.table.moves_count)
+        self.assertEqual(15, engine.table.size)
+
+        # unexpected errors are answered too
+        def broken(*args):
+            raise IndexError('broken search')
+
+        engine.table.choose_next_move = broken
+        response = engine.handle({'cmd': 'go', 'depth': 1})
+        self.assertFalse(response['ok'])
+        self.assertEqual('internal error: IndexError: broken search', response['error'])
+
+    def test_run(self):
+        stdout = io.StringIO()
+        Engine().run(io.StringIO('{"cmd": "stats"}\nnot json\n{"cmd": "nothing"}\n{"cmd": "quit"}\n{"cmd": "stats"}\n'),
+                     stdout)
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([True, False, False, True], [response['ok'] for response in responses])
+        self.assertEqual(0, responses[0]['moves_count'])
+        self.assertEqual(Engine().table.cache.info(), responses[0]['cache'])
+
+
+class TestAnalysis(unittest.TestCase):
+    def test_evaluate_positions(self):
+        board = ['.' * 15] * 15
+        board[7] = '.' * 3 + '1111' + '.' * 8
+        board[6] = '.' * 3 + '2222' + '.' * 8
+        positions = ['4,1;8;8,2;7;8,1;8;7,2;7;7',
+                     '\n'.join(board),
+                     [Move(1, Point(7, 7)), Move(1, Point(7, 8))],
+                     '1' * 15]
+        actual = list(evaluate_positions(positions, processes=0))
+        self.assertEqual([0, 1, 2, 3], [evaluation.index for evaluation in actual])
+
+        self.assertEqual(1, actual[0].move.program_number)
+        self.assertLessEqual(len(actual[0].options), 5)
+        self.assertEqual(sorted(actual[0].options, key=lambda v: -v[1]), actual[0].options)
+
+        self.assertIn(actual[1].move, [Move(1, Point(7, 2)), Move(1, Point(7, 7))])
+        self.assertTrue(actual[1].forced_win)
+
+        self.assertIsNone(actual[2].move)
+        self.assertIsNotNone(actual[2].error)
+        self.assertIsNotNone(actual[3].error)
+
+    def test_evaluate_positions_pool(self):
+        positions = ['4,1;8;8,2;7;8,1;8;7,2;7;7'] * 3
+        actual = list(evaluate_positions(positions, processes=2, chunksize=1))
+        self.assertEqual([0, 1, 2], [evaluation.index for evaluation in actual])
+        self.assertTrue(all(evaluation.move for evaluation in actual))
+
+        # positions are read only a few chunks ahead of the results
+        read = []
+
+        def generate_positions():
+            for i in range(100):
+                read.append(i)
+                yield positions[0]
+        evaluations = evaluate_positions(generate_positions(), processes=2, chunksize=2)
+        self.assertEqual(0, next(evaluations).index)
+        self.assertLessEqual(len(read), 2 * 2 * 2 + 2)
+        evaluations.close()
+
+    def test_analyse_game(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 7)), Move(1, Point(7, 6)), Move(2, Point(6, 6)),
+                 Move(1, Point(7, 5)), Move(2, Point(6, 5)), Move(1, Point(7, 4)), Move(2, Point(0, 0)),
+                 Move(1, Point(0, 14)), Move(2, Point(6, 4)), Move(1, Point(7, 3))]
+        actual = list(analyse_game(moves, depth=1))
+        self.assertEqual(list(range(11)), [analysis.ply for analysis in actual])
+        self.assertEqual(moves, [analysis.played for analysis in actual])
+
+        self.assertIn(actual[7].preferred.point, [Point(7, 3), Point(7, 8)])
+        self.assertTrue(set(actual[7].threats) & {Point(7, 3), Point(7, 8)})
+        self.assertTrue(actual[8].missed_win)
+        self.assertFalse(actual[6].missed_win)
+        self.assertTrue(actual[10].win)
+        for analysis in actual:
+            if analysis.played.point == analysis.preferred.point:
+                self.assertEqual(analysis.preferred_score, analysis.played_score)
+            self.assertGreaterEqual(analysis.preferred_score, 0)
+
+    def test_analyse_game_foul(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(7, 7)), Move(1, Point(6, 6))]
+        actual = list(analyse_game(moves, depth=1))
+        self.assertEqual(2, len(actual))
+        self.assertTrue(actual[1].foul)
+
+
+class TestMCTS(unittest.TestCase):
+    moves = [Move(1, Point(7, 7)), Move(2, Point(6, 8)), Move(1, Point(8, 6)), Move(2, Point(5, 5))]
+
+    def test_win(self):
+        table = Table([Move(1, Point(7, 7)), Move(2, Point(6, 7)), Move(1, Point(7, 6)), Move(2, Point(6, 6)),
+                       Move(1, Point(7, 5)), Move(2, Point(0, 0)), Move(1, Point(7, 4)), Move(2, Point(14, 14))])
+        table.compute()
+        with MCTS(16, processes=0, seed=0) as mcts:
+            self.assertIn(mcts.search(table), [Move(1, Point(7, 3)), Move(1, Point(7, 8))])
+
+    def test_rollout(self):
+        table = Table(self.moves[:])
+        table.compute()
+        winner = rollout(table, 1, random.Random(0), 200)
+        self.assertIn(winner, [0, 1, 2])
+        if winner:
+            self.assertTrue(any(table.is_win(winner, point) for point in table.table))
+
+    def test_tree_reused(self):
+        table = Table(self.moves[:])
+        table.compute()
+        with MCTS(16, processes=0, batch=4, seed=0) as mcts:
+            move = mcts.search(table)
+            self.assertEqual(16, mcts.rollouts)
+            self.assertEqual(move.program_number, 1)
+            self.assertIn(move.point, mcts.root.children)
+            child = mcts.root.children[move.point]
+            visits = child.visits
+            table.compute_move(move)
+            mcts.search(table)
+            self.assertIs(child, mcts.root)
+            self.assertEqual(visits + 16, child.visits)
+
+    def test_pool(self):
+        table = Table(self.moves[:])
+        table.compute()
+        with MCTS(4, processes=1, batch=4, width=3, seed=0) as mcts:
+            move = mcts.search(table)
+            self.assertEqual(4, mcts.rollouts)
+            self.assertEqual(3, len(mcts.root.children))
+            self.assertIn(move.point, mcts.root.children)
+
+
+class TestTactics(unittest.TestCase):
+    def test_load_tactics(self):
+        tactics = load_tactics()
+        self.assertTrue(tactics)
+        for tactic in tactics:
+            table = Table(tactic.moves[:])
+            self.assertEqual((None, None), table.compute())
+            self.assertTrue(all(point not in table.table for point in tactic.answers))
+
+        with open('tmp', 'w') as f:
+            f.write('# comment\n\nfive\tforced win\t8\t1,1;8;8\n')
+        self.assertRaises(ValueError, load_tactics, 'tmp')
+
+    def test_run_tactics(self):
+        tactics = [tactic for tactic in load_tactics() if tactic.category in ('forced win', 'must block')]
+        results = list(run_tactics(tactics, depths=[1]))
+        self.assertEqual(len(tactics), len(results))
+        self.assertTrue(all(result.solved for result in results))
+        self.assertIn('solved {0}/{0}'.format(len(tactics)), report(results))
+
+    def test_nodes(self):
+        tactic = [tactic for tactic in load_tactics() if tactic.name == 'white_vcf']
+        shallow, deep = run_tactics(tactic, depths=[1, 2])
+        # points evaluated, even if the searches are settled in few calls of `choose_next_move`
+        self.assertGreater(shallow.nodes, 1)
+        self.assertGreater(deep.nodes, shallow.nodes)
+
+
+class TestService(unittest.TestCase):
+    def test_sessions(self):
+        async def run():
+            service = Service(processes=0, max_pending=1)
+            try:
+                for game in ('a', 'b'):
+                    self.assertTrue((await service.handle({'cmd': 'new', 'game': game, 'moves': [[1, 8, 8]],
+                                                           'time_budget': 10}))['ok'])
+                responses = await asyncio.gather(*(service.handle({'cmd': 'go', 'game': game, 'depth': 1,
+                                                                   'play': True}) for game in ('a', 'b')))
+                # only one search can wait
+                self.assertEqual(['a', 'b'], [response['game'] for response in responses])
+                self.assertEqual([True, False], [response['ok'] for response in responses])
+                self.assertEqual('busy', responses[1]['error'])
+                self.assertEqual(2, responses[0]['moves_count'])
+                self.assertLess(responses[0]['remaining'], 10)
+
+                response = await service.handle({'cmd': 'stats', 'game': 'b', 'id': 3})
+                self.assertEqual((1, 2, 3), (response['moves_count'], response['games'], response['id']))
+                # counters of the workers which searched
+                self.assertEqual(1, len(response['caches']))
+                self.assertGreater(response['caches'][0]['nodes'], 0)
+                self.assertNotIn('cache', response)
+                self.assertFalse((await service.handle({'cmd': 'play', 'game': 'c', 'y': 1, 'x': 1}))['ok'])
+                self.assertTrue((await service.handle({'cmd': 'close', 'game': 'b'}))['ok'])
+                self.assertFalse((await service.handle({'cmd': 'stats', 'game': 'b'}))['ok'])
+
+                service.sessions['a'].remaining = 0
+                response = await service.handle({'cmd': 'go', 'game': 'a'})
+                self.assertEqual('time budget is exhausted', response['error'])
+            finally:
+                service.close()
+
+        asyncio.run(run())
+
+    def test_engine_kept(self):
+        key = -1  # not a key of any session
+        self.addCleanup(_engines.pop, key, None)
+        moves = [[1, 8, 8], [2, 7, 9]]
+        _go(key, 15, moves[:1], {'depth': 1})
+        engine = _engines[key]
+        _go(key, 15, moves, {'depth': 1})
+        # the move played since the last search is placed on the same table
+        self.assertIs(engine, _engines[key])
+        self.assertEqual(Move(2, Point(6, 8)), engine.table.moves[-1])
+        # taken back
+        _go(key, 15, moves[:1], {'depth': 1})
+        self.assertIsNot(engine, _engines[key])
+        self.assertEqual(1, _engines[key].table.moves_count)
+
+    def test_broken_pool(self):
+        async def run():
+            service = Service(processes=1)
+            try:
+                self.assertTrue((await service.handle({'cmd': 'new', 'game': 'a', 'moves': [[1, 8, 8]]}))['ok'])
+                # a worker dies
+                service.executor.submit(os._exit, 1)
+                response = await service.handle({'cmd': 'go', 'game': 'a', 'depth': 1})
+                self.assertFalse(response['ok'])
+                self.assertIn('BrokenProcessPool', response['error'])
+                self.assertEqual('a', response['game'])
+                # a new pool takes the next search
+                self.assertTrue((await service.handle({'cmd': 'go', 'game': 'a', 'depth': 1}))['ok'])
+            finally:
+                service.close()
+
+        asyncio.run(run())
+
+    def test_serve(self):
+        async def run():
+            service = Service(processes=0)
+            server = await service.start()
+            try:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname())
+                commands = [{'cmd': 'new', 'game': 1}, {'cmd': 'go', 'game': 1, 'depth': 1}, 'broken',
+                            {'cmd': 'quit'}]
+                writer.write(''.join(json.dumps(command) + '\n' for command in commands).encode())
+                responses = [json.loads(await reader.readline()) for _ in commands]
+                self.assertEqual([True, True, False, True], [response['ok'] for response in responses])
+                self.assertEqual(b'', await reader.readline())
+                writer.close()
+            finally:
+                server.close()
+                service.close()
+
+        asyncio.run(run())
+
+
+class TestProfiler(unittest.TestCase):
+    def test_profiler(self):
+        table = Table([Move(1, Point(7, 7)), Move(2, Point(6, 7)), Move(1, Point(8, 8)), Move(2, Point(6, 6))])
+        table.compute()
+        for ext in ('.txt', '.folded', '.prof'):
+            self.addCleanup(os.remove, 'tmp' + ext)
+        with Profiler('tmp', interval=0.0005) as profiler:
+            with profiler.search('move 5'):
+                table.choose_next_move(1, 2, 3)
+        label, seconds, peak = profiler.searches[0]
+        self.assertEqual('move 5', label)
+        self.assertGreater(peak, 0)
+        report = profiler.report()
+        self.assertIn('hot spots', report)
+        self.assertIn('main.py', report)
+
+        with open('tmp.folded') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(any('choose_next_move' in line for line in lines))
+        for line in lines:
+            stack, samples = line.rsplit(' ', 1)
+            self.assertGreater(int(samples), 0)
+
+    def test_engine_go(self):
+        engine = Engine()
+        engine.handle({'cmd': 'new', 'moves': [[1, 8, 8], [2, 7, 8]]})
+        for ext in ('.txt', '.folded', '.prof'):
+            self.addCleanup(os.remove, 'tmp' + ext)
+        actual = engine.handle({'cmd': 'go', 'depth': 1, 'profile': 'tmp', 'memory': False})
+        self.assertEqual(['tmp.txt', 'tmp.folded', 'tmp.prof'], actual['profile'])
+        self.assertIsNone(actual['peak'])
+        self.assertTrue(all(os.path.exists(path) for path in actual['profile']))
+
+
+class TestSelfPlay(unittest.TestCase):
+    def test_play_game(self):
+        record = play_game(0, depth=1, max_moves=6)
+        self.assertEqual(6, len(record.moves))
+        self.assertEqual([1, 2, 1, 2, 1, 2], record.players)
+        self.assertEqual(bytes(15 * 15), record.boards[0])
+        # from the view of the player to move
+        self.assertEqual(2, record.boards[1][record.moves[0]])
+        self.assertEqual(2, record.boards[2][record.moves[1]])
+        self.assertEqual(1, record.boards[2][record.moves[0]])
+        # openings are decided by the seed
+        self.assertEqual(record.moves[:4], play_game(0, depth=1, max_moves=4).moves)
+        self.assertNotEqual(record.moves[:4], play_game(0, depth=1, max_moves=4, seed=1).moves)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_generate_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(3, generate(directory, 3, processes=0, depth=1, max_moves=6, shard_size=10))
+            self.assertEqual([[0, 1], [2]], [shard['games'] for shard in read_manifest(directory)['shards']])
+            # only the new game is played
+            self.assertEqual(1, generate(directory, 4, processes=0, depth=1, max_moves=6, shard_size=10))
+            shards = list(load_shards(directory))
+            self.assertEqual([12, 6, 6], [len(shard['moves']) for shard in shards])
+            self.assertEqual((12, 2, 15, 15), shards[0]['boards'].shape)
+            self.assertEqual(list(range(6)), shards[0]['boards'][:6].sum(axis=(1, 2, 3)).tolist())
+            self.assertEqual([3] * 6, shards[2]['games'].tolist())
+
+
+class TestCluster(unittest.TestCase):
+    def test_validate_archive(self):
+        self.assertEqual({'name': 'a', 'moves': 9, 'valid': True, 'winner': 1, 'error': None},
+                         validate_archive('a', '9,1;8;4,2;7;4,1;8;5,2;7;5,1;8;6,2;7;6,1;8;7,2;1;1,1;8;8'))
+        self.assertEqual('moves after the win of move 9',
+                         validate_archive('a', '10,1;8;4,2;7;4,1;8;5,2;7;5,1;8;6,2;7;6,1;8;7,2;1;1,1;8;8,2;2;2')['error'])
+        self.assertEqual("move 2 can't be placed, Move(program_number=2, point=Point(y=7, x=7))",
+                         validate_archive('a', '2,1;8;8,2;8;8')['error'])
+        # the ply of a repeated move is where it is repeated
+        self.assertEqual("move 3 can't be placed, Move(program_number=1, point=Point(y=7, x=7))",
+                         validate_archive('a', '3,1;8;8,2;1;1,1;8;8')['error'])
+        self.assertFalse(validate_archive('a', '3,1;8;8')['valid'])
+
+    def test_coordinator(self):
+        tasks = [('validate', {'name': str(i), 'data': '2,1;8;8,2;{};1'.format(i + 1)}) for i in range(6)]
+        tasks += [('evaluate', {'index': 0, 'position': '3,1;8;8,2;7;7,1;8;9'}), ('unknown', {}),
+                  ('play', {'index': 0, 'depth': 1, 'max_moves': 4})]
+
+        async def run():
+            coordinator = Coordinator(tasks)
+            server = await coordinator.start()
+            port = server.sockets[0].getsockname()[1]
+            try:
+                # a worker which dies with its tasks
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(b'{"cmd": "ready", "slots": 2}\n')
+                taken = [json.loads(await reader.readline())['task'] for _ in range(2)]
+                writer.close()
+
+                workers = [asyncio.ensure_future(work('127.0.0.1', port, processes=0, slots=2)) for _ in range(2)]
+                results = {index: (result, error) async for index, result, error in coordinator.collect()}
+                await asyncio.wait_for(asyncio.gather(*workers), 10)
+                await coordinator.wait_closed()
+            finally:
+                server.close()
+            return coordinator, taken, results
+
+        coordinator, taken, results = asyncio.run(run())
+        self.assertEqual(set(range(len(tasks))), set(results))
+        self.assertEqual([0, 1], taken)
+        self.assertEqual(2, coordinator.requeued)
+        self.assertEqual([str(i) for i in range(6)], [results[i][0]['name'] for i in range(6)])
+        self.assertTrue(all(results[i][0]['valid'] for i in range(6)))
+        self.assertEqual({'program_number': 2, 'y': 8, 'x': 10}, results[6][0]['move'])
+        self.assertIsNone(results[7][0])
+        self.assertIn('unknown task', results[7][1])
+        record = record_from_json(results[8][0])
+        self.assertEqual(play_game(0, depth=1, max_moves=4), record)
+
+    def test_coordinator_timeout(self):
+        async def run():
+            coordinator = Coordinator([('validate', {'name': 'a', 'data': '1,1;8;8'})], timeout=0.1)
+            server = await coordinator.start()
+            port = server.sockets[0].getsockname()[1]
+            try:
+                # a worker which takes the task and never answers
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(b'{"cmd": "ready"}\n')
+                await reader.readline()
+                worker = asyncio.ensure_future(work('127.0.0.1', port, processes=0))
+                results = [result async for _, result, _ in coordinator.collect()]
+                await asyncio.wait_for(worker, 10)
+                writer.close()
+            finally:
+                server.close()
+            return coordinator, results
+
+        coordinator, results = asyncio.run(run())
+        self.assertEqual(1, coordinator.requeued)
+        self.assertEqual([True], [result['valid'] for result in results])
+
+    def test_coordinator_broken_pool(self):
+        async def run():
+            tasks = [('validate', {'name': name, 'data': '1,1;8;8'}) for name in 'ab']
+            coordinator = Coordinator(tasks)
+            server = await coordinator.start()
+            port = server.sockets[0].getsockname()[1]
+            # a process of the pool dies, as if a task crashed it
+            executor = ProcessPoolExecutor(1)
+            self.assertRaises(BrokenExecutor, executor.submit(os._exit, 1).result)
+            try:
+                await asyncio.wait_for(work('127.0.0.1', port, slots=2, executor=executor), 10)
+                worker = asyncio.ensure_future(work('127.0.0.1', port, processes=0))
+                results = [(result, error) async for _, result, error in coordinator.collect()]
+                await asyncio.wait_for(worker, 10)
+            finally:
+                server.close()
+            return coordinator, results
+
+        coordinator, results = asyncio.run(run())
+        self.assertEqual(2, coordinator.requeued)
+        self.assertEqual([(True, None)] * 2, [(result['valid'], error) for result, error in results])
+
+
+class TestArchive(unittest.TestCase):
+    def test_canonical_hash(self):
+        moves = [Move(1, Point(7, 7)), Move(2, Point(6, 8)), Move(1, Point(8, 5))]
+        rotated = [Move(move.program_number, Point(move.point.x, 14 - move.point.y)) for move in moves]
+        mirrored = [Move(move.program_number, Point(move.point.y, 14 - move.point.x)) for move in moves]
+        expected = canonical_hash(moves)
+        self.assertEqual(expected, canonical_hash(rotated))
+        self.assertEqual(expected, canonical_hash(mirrored))
+        self.assertEqual(expected, canonical_hash(moves[::-1]))
+        table = Table(rotated[:])
+        table.compute()
+        self.assertEqual(expected, canonical_hash(table))
+        self.assertNotEqual(expected, canonical_hash([Move(2, Point(7, 7))] + moves[1:]))
+        # stones are keyed by colour, not by program_number
+        self.assertEqual(expected, canonical_hash([Move(3 - move.program_number, move.point) for move in moves]))
+        self.assertRaises(ValueError, canonical_hash, moves + [Move(2, Point(7, 7))])
+        self.assertRaises(ValueError, canonical_hash, [Move(1, Point(7, 15))])
+
+    def test_position_index(self):
+        games = ['3,1;8;8,2;7;9,1;9;6', '3,1;8;8,2;9;7,1;6;9', '2,1;8;8,2;8;8', '2,1;8;8,2;1;1']
+        segments = config.INDEX_SEGMENTS
+        with tempfile.TemporaryDirectory() as directory:
+            archive = os.path.join(directory, 'games.txt')
+            with open(archive, 'w') as f:
+                f.write('\n'.join(games[:3]) + '\n' + games[3])
+            with self.assertWarns(UserWarning):
+                with PositionIndex(os.path.join(directory, 'index')) as index:
+                    # the last line is read after its newline
+                    self.assertEqual(3, index.update(archive))
+            with PositionIndex(os.path.join(directory, 'index')) as index:
+                self.assertEqual(3, index.games)
+                self.assertEqual([(0, 1), (1, 1)], index.find([Move(1, Point(7, 7))]))
+                # the second game is a reflection of the first one
+                self.assertEqual([(0, 3), (1, 3)], index.find(parse_data(games[0])[1]))
+                self.assertEqual([], index.find(parse_data(games[3])[1]))
+
+                with open(archive, 'a') as f:
+                    f.write('\n' + games[3] + '\n')
+                try:
+                    config.INDEX_SEGMENTS = 2
+                    self.assertEqual(2, index.update(archive))
+                    self.assertEqual(2, len(index.manifest['segments']))
+                    self.assertEqual([(3, 2), (4, 2)], index.find(parse_data(games[3])[1]))
+                    with open(archive, 'a') as f:
+                        f.write(games[0] + '\n')
+                    self.assertEqual(1, index.update(archive))
+                finally:
+                    config.INDEX_SEGMENTS = segments
+                # merged into one
+                self.assertEqual(['segment-00003.idx'], [segment['file'] for segment in index.manifest['segments']])
+                self.assertEqual([(0, 3), (1, 3), (5, 3)], index.find(parse_data(games[0])[1]))
+            self.assertEqual(['games.txt', 'index'], sorted(os.listdir(directory)))
+            self.assertEqual(['manifest.json', 'segment-00003.idx'], sorted(os.listdir(os.path.join(directory, 'index'))))
+
+
+class TestGUI(unittest.TestCase):
+    def test_cell_center(self):
+        self.assertEqual((32, 32), cell_center(Point(0, 0), 32, 32))
+        self.assertEqual((96, 64), cell_center(Point(1, 2), 32, 32))
+
+    def test_cell_at(self):
+        for point in [Point(0, 0), Point(7, 3), Point(14, 14)]:
+            self.assertEqual(point, cell_at(*cell_center(point, 32, 32), 32, 32, 15))
+        # nearest intersection
+        self.assertEqual(Point(1, 2), cell_at(96 + 15, 64 - 15, 32, 32, 15))
+        self.assertEqual(Point(1, 3), cell_at(96 + 17, 64 - 15, 32, 32, 15))
+        # out of the table
+        self.assertIsNone(cell_at(2, 2, 32, 32, 15))
+        self.assertIsNone(cell_at(32 * 16, 32, 32, 32, 15))
+
 
 if __name__ == "__main__":
     unittest.main()